@@ -15,6 +15,9 @@ use std::net::SocketAddr;
 use tower_http::{cors::CorsLayer, trace::TraceLayer};
 use tracing_subscriber::{fmt, prelude::*, EnvFilter};
 
+// ES rejects a terms query with more values than index.max_terms_count, 65,536 by default
+const MAX_TERMS_COUNT: usize = 65_536;
+
 #[tokio::main]
 async fn main() -> anyhow::Result<()> {
     dotenv().ok();
@@ -31,7 +34,7 @@ async fn main() -> anyhow::Result<()> {
         .init();
 
     let app = Router::new()
-        .route("/releases", get(releases))
+        .route("/releases", get(releases).post(releases_with_hidden))
         .route("/release", get(release))
         .route("/filters", get(filters))
         .layer(TraceLayer::new_for_http())
@@ -123,6 +126,11 @@ struct QueryParameters {
     #[serde(default, deserialize_with = "from_base64")]
     hide: Option<RoaringBitmap>,
     search_after: Option<String>,
+    pit: Option<String>,
+    // fields to return from each release's _source, everything when unset
+    source: Option<Vec<String>>,
+    // false skips counting the matches, for callers that already know the total
+    track_total_hits: Option<bool>,
 }
 
 fn from_base64<'a, D>(deserializer: D) -> Result<Option<RoaringBitmap>, D::Error>
@@ -276,7 +284,7 @@ async fn releases(
         })]);
     }
 
-    if params.0.hide.is_some() {
+    if let Some(hide) = &params.0.hide {
         // following needs the plugin to work on ES
         // must_filters.push(json!(
         //     {
@@ -293,11 +301,14 @@ async fn releases(
         //         }
         //     }
         // ))
-        must_not.push(json!({
-                    "terms": {
-                        "_id": params.0.hide.unwrap().iter().collect::<Vec<u32>>()
-                    }
-        }));
+        let hidden = hide.iter().collect::<Vec<u32>>();
+        for chunk in hidden.chunks(MAX_TERMS_COUNT) {
+            must_not.push(json!({
+                "terms": {
+                    "_id": chunk
+                }
+            }));
+        }
     }
 
     let mut json = json!({
@@ -363,17 +374,35 @@ async fn releases(
         json["search_after"] = serde_json::from_str(&params.0.search_after.unwrap()).unwrap();
     }
 
+    if let Some(source) = params.0.source {
+        json["_source"] = json!({ "includes": source });
+    }
+
+    if let Some(track_total_hits) = params.0.track_total_hits {
+        json["track_total_hits"] = json!(track_total_hits);
+    }
+
+    // a point in time pins the index itself, the request must not name one
+    let parts = if let Some(pit) = params.0.pit {
+        json["pit"] = json!({"id": pit, "keep_alive": "10m"});
+        elasticsearch::SearchParts::None
+    } else {
+        elasticsearch::SearchParts::Index(&["releases"])
+    };
+
     tracing::debug!("{}", to_string_pretty(&json).unwrap());
 
     let search = client
-        .search(elasticsearch::SearchParts::Index(&["releases"]))
+        .search(parts)
         .size(params.0.size.unwrap_or(10))
         .from(params.0.from.unwrap_or(0))
         .body(json)
         .send()
         .await?;
 
-    let builder = Response::builder().status(200);
+    // pass ES failures on as they are, an expired point in time is a 404 the
+    // frontend recovers from
+    let builder = Response::builder().status(search.status_code().as_u16());
 
     let body = search.json::<Value>().await?;
 
@@ -383,19 +412,42 @@ async fn releases(
         .map_err(|e| e.into())
 }
 
+// Same as `releases`, but the bitmap of hidden ids is the raw request body so it
+// doesn't have to fit in the query string.
+async fn releases_with_hidden(
+    client: Extension<Elasticsearch>,
+    mut params: axum_extra::extract::Query<QueryParameters>,
+    body: axum::body::Bytes,
+) -> Result<axum::response::Response, error::Error> {
+    if !body.is_empty() {
+        params.0.hide = Some(RoaringBitmap::deserialize_from(&*body).map_err(anyhow::Error::from)?);
+    }
+
+    releases(client, params).await
+}
+
 #[derive(Debug, Deserialize, Serialize)]
 struct ReleaseQueryParameters {
     id: String,
+    source: Option<Vec<String>>,
 }
 
 async fn release(
     Extension(client): Extension<Elasticsearch>,
     params: axum_extra::extract::Query<ReleaseQueryParameters>,
 ) -> Result<axum::response::Response, error::Error> {
-    let search = client
-        .get(elasticsearch::GetParts::IndexId("releases", &params.0.id))
-        .send()
-        .await?;
+    let includes: Vec<&str> = params
+        .0
+        .source
+        .iter()
+        .flatten()
+        .map(String::as_str)
+        .collect();
+    let mut get = client.get(elasticsearch::GetParts::IndexId("releases", &params.0.id));
+    if !includes.is_empty() {
+        get = get._source_includes(&includes);
+    }
+    let search = get.send().await?;
 
     let builder = Response::builder().status(200);
 
@@ -0,0 +1,2 @@
+-- Add migration script here
+ALTER TABLE users ADD COLUMN wantlist_version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,3 @@
+-- Add migration script here
+ALTER TABLE users ADD COLUMN hidden bytea;
+ALTER TABLE users ADD COLUMN hidden_version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,8 @@
+-- Add migration script here
+CREATE TABLE wantlist_changes (
+        change_id       BIGINT  GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        user_id         INT     NOT NULL REFERENCES users(user_id),
+        release_id      INT     NOT NULL,
+        wanted          BOOLEAN NOT NULL
+);
+CREATE INDEX wantlist_changes_user_id_idx ON wantlist_changes (user_id, change_id);
@@ -0,0 +1,8 @@
+-- Add migration script here
+CREATE TABLE wantlist_syncs (
+        user_id         INT              PRIMARY KEY REFERENCES users(user_id),
+        state           TEXT             NOT NULL,
+        started         DOUBLE PRECISION NOT NULL,
+        heartbeat       DOUBLE PRECISION NOT NULL,
+        progress        JSON             NOT NULL
+);
@@ -0,0 +1,118 @@
+"""A long-lived event loop per worker process.
+
+Flask runs every ``async`` view on a throwaway event loop, so async clients
+(and their connection pools) created inside a view die with the request.
+Instead each worker runs one loop on a daemon thread which owns the shared
+clients, and views hand their coroutines to it with ``run``.
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import os
+import threading
+
+_lock = threading.Lock()
+_loop = None
+_latest = {}
+_shutdown_hooks = []
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop  # noqa: PLW0603
+
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="aio", daemon=True).start()
+        return _loop
+
+
+def _reset_after_fork():
+    # the loop thread does not survive a fork, the child starts its own on first use
+    global _loop, _lock, _latest  # noqa: PLW0603
+
+    _loop = None
+    _lock = threading.Lock()
+    _latest = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """Schedule ``coro`` on the worker loop from any thread.
+
+    The coroutine runs in a copy of the caller's context so request-scoped
+    state (flask's request/app context) is still visible to it.
+    """
+    loop = get_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def done(task):
+        if future.cancelled():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        task = loop.create_task(coro, context=context)
+        task.add_done_callback(done)
+        future.add_done_callback(
+            lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel),
+        )
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+async def run(coro):
+    """Await ``coro`` on the worker loop from whatever loop the caller is on."""
+    if asyncio.get_running_loop() is _loop:
+        return await coro
+    return await asyncio.wrap_future(submit(coro))
+
+
+async def run_latest(key, coro):
+    """Like ``run``, but cancels any earlier call still running under ``key``."""
+    future = submit(coro)
+    with _lock:
+        previous = _latest.get(key)
+        _latest[key] = future
+    if previous is not None:
+        previous.cancel()
+    try:
+        return await asyncio.wrap_future(future)
+    finally:
+        with _lock:
+            if _latest.get(key) is future:
+                del _latest[key]
+
+
+def block(coro, timeout=None):
+    """Run ``coro`` on the worker loop and wait for it from synchronous code."""
+    return submit(coro).result(timeout)
+
+
+def on_shutdown(hook):
+    """Register a coroutine function to await before the worker exits."""
+    _shutdown_hooks.append(hook)
+    return hook
+
+
+@atexit.register
+def shutdown():
+    if _loop is None:
+        return
+
+    async def close_all():
+        await asyncio.gather(*(hook() for hook in _shutdown_hooks), return_exceptions=True)
+
+    block(close_all(), timeout=10)
+    _loop.call_soon_threadsafe(_loop.stop)
@@ -1,36 +1,56 @@
 import asyncio
 import base64
+import functools
+import hashlib
+import json
 import os
 import re
-from time import sleep
+import secrets
+import time
+from pathlib import Path
+from typing import NamedTuple
 
+import elasticsearch
 import flask
 import flask_htmx
-import httpx
 import werkzeug
 import werkzeug.datastructures
-from authlib.integrations.flask_client import OAuth
+from authlib.integrations.flask_client import FlaskOAuth1App, OAuth
 from colorhash import ColorHash
 from dotenv import load_dotenv
-from elasticapm.contrib.flask import ElasticAPM
-from elasticsearch import Elasticsearch
 from flask import Flask, jsonify, redirect, render_template, request, session, url_for
 from flask_caching import Cache
 from flask_htmx import HTMX, make_response
-from flask_sqlalchemy import SQLAlchemy
 from jinja2 import StrictUndefined
-from posthog import Posthog
-from pyroaring import BitMap
-from sqlalchemy import update
+from pyroaring import BitMap, FrozenBitMap
+from sqlalchemy import and_, bindparam, case, delete, event, exists, null, update
 from sqlalchemy.dialects.postgresql import insert
-
-from exeptions import LoggedOutError
-
-posthog = Posthog(
-    project_api_key=os.environ.get("POSTHOG_API_KEY"),
-    host="https://us.i.posthog.com",
-    enable_exception_autocapture=True,
+from sqlalchemy.engine import Engine
+
+import aio
+import name_index
+import timings
+import wantlist_sync
+from caches import BitmapCache, Prefetcher
+from clients import (
+    axum,
+    axum_sync,
+    db_execute,
+    es,
+    es_close_point_in_time,
+    es_get,
+    es_open_point_in_time,
+    es_search,
+    pool_stats,
+    posthog,
 )
+from discogs_cache import DiscogsCache
+from exeptions import DiscogsRejectedError, LoggedOutError, PitExpiredError
+from file_cache import SharedValue
+from models import Action, User, WantlistChange, WantlistSync, db
+from outbox import Outbox, RejectedError
+from prices import PriceService
+from write_behind import WriteBehind
 
 config = {
     "DEBUG": True,  # some Flask specific configs
@@ -40,15 +60,90 @@ config = {
 
 load_dotenv()
 
-db = SQLAlchemy()
+# "loop" runs the async views of a worker on its one event loop, where requests
+# waiting on I/O overlap; "thread" is Flask's fresh loop per request, which
+# holds the request's thread until the view returns
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "thread")
+
+
+class App(Flask):
+    def async_to_sync(self, func):
+        if ASYNC_VIEWS != "loop":
+            return super().async_to_sync(func)
+        return lambda *args, **kwargs: aio.block(func(*args, **kwargs))
 
-app = Flask(__name__, static_url_path="/public")
+
+async def blocking(func, *args, **kwargs):
+    """Call blocking ``func`` from an async view without holding up the loop."""
+    if ASYNC_VIEWS != "loop":
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+app = App(__name__, static_url_path="/public")
 app.config.from_mapping(config)
+# point every worker at one backend (e.g. RedisCache or FileSystemCache) to share cached fragments
+app.config.update(
+    {
+        key: os.environ[key]
+        for key in ("CACHE_TYPE", "CACHE_REDIS_URL", "CACHE_DIR", "CACHE_KEY_PREFIX")
+        if key in os.environ
+    },
+)
 
 app.jinja_env.undefined = StrictUndefined
 
 cache = Cache(app)
 
+DISCOGS_API = os.environ.get("DISCOGS_API", "https://api.discogs.com")
+
+FILTER_CACHE_TIMEOUT = int(os.environ.get("FILTER_CACHE_TIMEOUT", "60"))
+# keep below PIT_KEEP_ALIVE, cached pages carry a cursor into their point in time
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get("FRAGMENT_CACHE_TIMEOUT", "300"))
+# pending wants/unwants a user may pile up before they are folded into the bitmap
+WANTLIST_COMPACT_AFTER = int(os.environ.get("WANTLIST_COMPACT_AFTER", "64"))
+# a running sync that hasn't reported for this long lost its worker, another may take over
+WANTLIST_SYNC_STALE = int(os.environ.get("WANTLIST_SYNC_STALE", "300"))
+RELEASE_SMALL_TIMEOUT = int(os.environ.get("RELEASE_SMALL_TIMEOUT", "86400"))
+# the index only changes when a dump is loaded, a listing's total is reused for
+# every page turn until then; 0 counts the matches of every page again
+TOTAL_CACHE_TIMEOUT = int(os.environ.get("TOTAL_CACHE_TIMEOUT", "3600"))
+
+MAX_RESULT_WINDOW = 10000
+PIT_KEEP_ALIVE = "10m"
+# listings a session keeps a point in time open for, the oldest is closed past that
+SESSION_PITS = 2
+PAGING_PARAMS = {"page", "pageSize", "offset", "from", "cursor", "search_after"}
+
+# the release fields each template reads, searches fetch nothing else from ES
+RELEASE_SMALL_FIELDS = ["title", "released", "artists.name", "styles"]
+SEARCH_FIELDS = ["title", "released", "artists.name"]
+DISCOVER_FIELDS = [
+    "title",
+    "released",
+    "videos",
+    "notes",
+    "styles",
+    "artists.id",
+    "artists.name",
+    "labels.id",
+    "labels.name",
+    "labels.catno",
+    "formats.text",
+    "formats.name",
+    "formats.descriptions",
+    "tracklist.position",
+    "tracklist.title",
+    "tracklist.duration",
+]
+DIG_FIELDS = [
+    *(f for f in DISCOVER_FIELDS if f != "artists.id"),
+    "country",
+    "identifiers.type",
+    "identifiers.value",
+    "master_id",
+]
+
 
 # set up colorhash filter
 def color_hash_hex(value):
@@ -69,44 +164,62 @@ app.config["ELASTIC_APM"] = {
     "DEBUG": os.environ.get("ELASTIC_APM_DEBUG", "false") == "true",
 }
 
-apm = ElasticAPM(app)
+if os.environ.get("APM_SERVER_URL"):
+    # the agent has to hook into the app before it serves, it can't wait for first use
+    from elasticapm.contrib.flask import ElasticAPM
+
+    apm = ElasticAPM(app)
 
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "supersekrit")
 
-AXUM_API = os.environ.get("AXUM_API", "https://acetate.onrender.com/")
-
 db.init_app(app)
 
-with app.app_context():
-    db.reflect()
-
-
-class User(db.Model):
-    __table__ = db.metadata.tables["users"]
-
-
-class Action(db.Model):
-    __table__ = db.metadata.tables["actions"]
+discogs_cache = DiscogsCache(
+    os.environ.get("DISCOGS_CACHE_PATH", Path(app.instance_path) / "discogs.sqlite3"),
+    ttls={
+        "release": (7 * 86400, 30 * 86400),
+        "price": (86400, 7 * 86400),
+        "master": (30 * 86400, 365 * 86400),
+    },
+)
+price_service = PriceService(discogs_cache)
+
+NAME_INDEX = os.environ.get("NAME_INDEX", "off") == "on"
+artist_names = name_index.LocalIndex(
+    "artists",
+    lambda: name_index.artist_records(es()),
+    Path(os.environ.get("NAME_INDEX_DIR", app.instance_path)) / "artists.idx",
+    int(os.environ.get("NAME_INDEX_REFRESH", "86400")),
+)
+label_names = name_index.LocalIndex(
+    "labels",
+    lambda: name_index.label_records(es()),
+    Path(os.environ.get("NAME_INDEX_DIR", app.instance_path)) / "labels.idx",
+    int(os.environ.get("NAME_INDEX_REFRESH", "86400")),
+)
 
+wantlist_cache = BitmapCache(int(os.environ.get("WANTLIST_CACHE_BYTES", str(64 * 2**20))))
+hidden_cache = BitmapCache(int(os.environ.get("HIDDEN_CACHE_BYTES", str(64 * 2**20))))
+prefetches = Prefetcher(int(os.environ.get("PREFETCH_SESSIONS", "1000")))
 
 htmx = HTMX(app)
 
 oauth = OAuth(app)
 
 
+class DiscogsApp(FlaskOAuth1App):
+    def request(self, method, url, token=None, **kwargs):
+        with timings.timed("discogs"):
+            return super().request(method, url, token=token, **kwargs)
+
+
 def get_token():
-    user = db.session.scalar(
-        db.select(User).where(
-            User.discogs_user_id == session.get("user").get("id"),
-        ),
-    )
-    return {
-        "oauth_token": user.discogs_oauth_token,
-        "oauth_token_secret": user.discogs_oauth_token_secret,
-    }
+    # from synchronous code, async views already have the context loaded
+    user = flask.g.get("user_context") or aio.block(current_user())
+    return user.token
 
 
 oauth.register(
@@ -117,6 +230,47 @@ oauth.register(
     access_token_url="https://api.discogs.com/oauth/access_token",  # noqa: S106
     authorize_url="https://www.discogs.com/oauth/authorize",
     fetch_token=get_token,
+    client_cls=DiscogsApp,
+)
+
+
+def send_want(entry):
+    """Make the Discogs call of an outbox entry with its user's token."""
+    with app.app_context():
+        user = db.session.scalar(
+            db.select(User).where(User.discogs_user_id == entry["user_id"]),
+        )
+    if user is None:
+        msg = "not logged in to Discogs"
+        raise RejectedError(msg)
+
+    response = oauth.discogs.request(
+        "PUT" if entry["wanted"] else "DELETE",
+        f"{DISCOGS_API}/users/{entry['username']}/wants/{entry['release_id']}",
+        token={
+            "oauth_token": user.discogs_oauth_token,
+            "oauth_token_secret": user.discogs_oauth_token_secret,
+        },
+        timeout=10,
+    )
+    if response.status_code == 404 and not entry["wanted"]:  # noqa: PLR2004
+        # not in the wantlist on discogs either
+        return
+    if response.status_code in (408, 429) or response.status_code >= 500:  # noqa: PLR2004
+        response.raise_for_status()
+    if response.status_code >= 400:  # noqa: PLR2004
+        try:
+            msg = response.json()["message"]
+        except (ValueError, KeyError, TypeError):
+            msg = f"Discogs answered {response.status_code}"
+        raise RejectedError(msg)
+
+
+discogs_outbox = Outbox(
+    os.environ.get("OUTBOX_PATH", Path(app.instance_path) / "outbox.sqlite3"),
+    send_want,
+    max_attempts=int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8")),
+    backoff=float(os.environ.get("OUTBOX_BACKOFF", "2")),
 )
 
 
@@ -126,11 +280,109 @@ def add_header(response):
     return response
 
 
+@app.before_request
+def start_timings():
+    flask.g.started = time.perf_counter()
+    timings.start()
+
+
+@app.before_request
+def start_outbox():
+    # also sends what a previous worker queued but didn't get to
+    discogs_outbox.start()
+
+
+@app.before_request
+def start_facets():
+    # never in a preloading master, the fetch would be running as it forks
+    facets.start()
+
+
+@app.before_request
+def start_name_index():
+    # like the facets, built or loaded in the workers only
+    if NAME_INDEX:
+        artist_names.start()
+        label_names.start()
+
+
+@app.after_request
+def add_server_timing(response):
+    total = time.perf_counter() - flask.g.started
+    timings.observe("request", request.endpoint, total)
+    breakdown = timings.server_timing()
+    response.headers["Server-Timing"] = ", ".join(
+        [*([breakdown] if breakdown else []), f"total;dur={total * 1000:.1f}"],
+    )
+    return response
+
+
+@flask.before_render_template.connect_via(app)
+def render_started(*_args, **_kwargs):
+    flask.g.render_started = time.perf_counter()
+
+
+@flask.template_rendered.connect_via(app)
+def render_done(*_args, **_kwargs):
+    timings.record("render", time.perf_counter() - flask.g.render_started)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def query_started(conn, *_args):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def query_done(conn, *_args):
+    timings.record("db", time.perf_counter() - conn.info["query_started"].pop())
+
+
 @app.route("/healthz")
 def healthz() -> str:
     return "ok"
 
 
+@app.route("/healthz/pools")
+def healthz_pools():
+    return jsonify(pool_stats())
+
+
+@app.route("/healthz/caches")
+def healthz_caches():
+    return jsonify(cache_stats())
+
+
+def cache_stats():
+    return {
+        "wantlist": wantlist_cache.stats(),
+        "hidden": hidden_cache.stats(),
+        "artist_names": artist_names.stats,
+        "label_names": label_names.stats,
+        "prefetch": prefetches.stats(),
+        "facets": facets.stats(),
+        "hides": hides.stats(),
+        "outbox": discogs_outbox.stats(),
+        "discogs": discogs_cache.stats(),
+    }
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus metrics of the worker that happens to serve the scrape."""
+    gauges = {"pool_connections": {}, "cache": {}}
+    for client, usage in pool_stats().items():
+        for state, value in usage.items():
+            gauges["pool_connections"][("client", client), ("state", state)] = value
+    for name, stats in cache_stats().items():
+        for stat, value in stats.items():
+            if isinstance(value, int | float) and not isinstance(value, bool):
+                gauges["cache"][("cache", name), ("stat", stat)] = value
+
+    response = make_response(timings.prometheus(gauges))
+    response.content_type = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
 @app.errorhandler(404)
 def page_not_found(_):
     return flask.redirect(url_for("discover"))
@@ -140,7 +392,7 @@ def page_not_found(_):
 def handle_exception(e):
     # Capture methods, including capture_exception, return the UUID of the captured event,
     # which you can use to find specific errors users encountered
-    event_id = posthog.capture_exception(e)
+    event_id = posthog().capture_exception(e)
 
     # You can show the event ID to your user, and ask them to include it in bug reports
     response = jsonify({"message": str(e), "error_id": event_id})
@@ -148,8 +400,54 @@ def handle_exception(e):
     return response
 
 
+def fragment_cached(view):
+    """Cache the htmx fragments a view renders and answer conditional requests.
+
+    Fragments are keyed by path, args and user, plus the versions of the
+    user's wantlist and hidden set, so wanting or hiding anything moves the
+    user on to fresh entries.
+    """
+
+    @functools.wraps(view)
+    async def wrapper(*args, **kwargs):
+        if not htmx or htmx.boosted:
+            return await view(*args, **kwargs)
+
+        key = await fragment_key()
+        cached = await blocking(cache.get, key)
+        if cached is None:
+            response = make_response(await view(*args, **kwargs))
+            if response.status_code != 200:  # noqa: PLR2004
+                return response
+            body = response.get_data()
+            cached = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
+            await blocking(cache.set, key, cached, timeout=FRAGMENT_CACHE_TIMEOUT)
+
+        body, etag = cached
+        response = make_response(body)
+        response.set_etag(etag)
+        # depends on the session cookie, browsers may keep it but must revalidate
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
+
+    return wrapper
+
+
+async def fragment_key():
+    if "user" in session:
+        context = await current_user()
+        user = context.discogs_user_id
+        versions = (context.wantlist_version, context.hidden_version, len(hides.pending(user)))
+    else:
+        user, versions = None, (0, 0, 0)
+    args = sorted(request.args.items(multi=True))
+    key = json.dumps([request.path, args, user, versions])
+    return "fragment/" + hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
 @app.route("/")
 @app.route("/discover")
+@fragment_cached
 async def discover():
     extra_args = {"pageSize": 10}
 
@@ -161,13 +459,14 @@ async def discover():
 
     if htmx and not htmx.boosted:
         async with asyncio.TaskGroup() as tg:
-            releases = tg.create_task(get_releases(args))
+            releases = tg.create_task(get_releases(args, DISCOVER_FIELDS, prefetch=True))
+            filters = tg.create_task(blocking(get_filters))
 
         return render_template(
             "discover/results.jinja",
             **{
                 **releases.result(),
-                "filters": get_filters(),
+                "filters": filters.result(),
                 "htmx": htmx,
                 "params": args,
                 **args,
@@ -179,25 +478,27 @@ async def discover():
         **{
             "htmx": htmx,
             "params": args,
-            "filters": get_filters(),
+            "filters": await blocking(get_filters),
             **args,
         },
     )
 
 
 @app.route("/dig")
+@fragment_cached
 async def dig():
     if htmx and not htmx.boosted:
         async with asyncio.TaskGroup() as tg:
             releases = tg.create_task(
-                get_releases(request.args, omit_hidden=False),
+                get_releases(request.args, DIG_FIELDS, omit_hidden=False, prefetch=True),
             )
+            filters = tg.create_task(blocking(get_filters))
 
         return render_template(
             "dig/results.jinja",
             **{
                 **releases.result(),
-                "filters": get_filters(),
+                "filters": filters.result(),
                 **request.args,
             },
         )
@@ -217,7 +518,7 @@ async def dig():
             "pageSize": page_size,
             "page": page,
             "from": offset,
-            "filters": get_filters(),
+            "filters": await blocking(get_filters),
             "hits": 0,
             **request.args,
         },
@@ -229,148 +530,431 @@ async def playlist():
     return render_template("playlist.jinja")
 
 
-es_client = Elasticsearch(
-    cloud_id=os.environ.get("ES_CLOUD_ID", "http://localhost:9200"),
-    basic_auth=("elastic", os.environ.get("ES_PASSWORD", "")),
-)
-
-
 @app.route("/filter")
 async def filter_view():
-    query = request.args.get("search")
-    releases = []
+    query = " ".join(request.args.get("search", "").split())
+    releases = await blocking(cache.get, f"filter/{query}") if query else []
 
-    if query:
-        releases = es_client.search(
-            index="releases",
-            body={
-                "query": {
-                    "bool": {
-                        "should": [
-                            {
-                                "nested": {
-                                    "path": "artists",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "fields": [
-                                                "artists.name^5",
-                                                "artists.anv^2",
-                                            ],
-                                        },
+    if releases is None:
+        try:
+            releases = await filter_search(query)
+        except asyncio.CancelledError:
+            # a newer keystroke from the same session replaced this search
+            return "", 204
+        await blocking(cache.set, f"filter/{query}", releases, timeout=FILTER_CACHE_TIMEOUT)
+
+    if htmx and not htmx.boosted:
+        return render_template(
+            "search.jinja",
+            **{
+                "releases": enrich_releases(releases, await load_wantlist()),
+                **request.args,
+            },
+        )
+
+    return render_template(
+        "filter.jinja",
+        **{
+            "releases": enrich_releases(releases, await load_wantlist()),
+            **request.args,
+        },
+    )
+
+
+async def filter_search(query):
+    releases = await es_search(
+        supersede=("filter", session_key()),
+        index="releases",
+        body={
+            "query": {
+                "bool": {
+                    "should": [
+                        {
+                            "nested": {
+                                "path": "artists",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "fields": [
+                                            "artists.name^5",
+                                            "artists.anv^2",
+                                        ],
                                     },
                                 },
                             },
-                            {
-                                "nested": {
-                                    "path": "extraartists",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "fields": [
-                                                "extraartists.name",
-                                                "extraartists.anv",
-                                            ],
-                                        },
+                        },
+                        {
+                            "nested": {
+                                "path": "extraartists",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "fields": [
+                                            "extraartists.name",
+                                            "extraartists.anv",
+                                        ],
                                     },
                                 },
                             },
-                            {
-                                "nested": {
-                                    "path": "labels",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "fields": [
-                                                "labels.name",
-                                                "labels.catno^5",
-                                            ],
-                                        },
+                        },
+                        {
+                            "nested": {
+                                "path": "labels",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "fields": [
+                                            "labels.name",
+                                            "labels.catno^5",
+                                        ],
                                     },
                                 },
                             },
-                            {
-                                "nested": {
-                                    "path": "identifiers",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "fields": [
-                                                "identifiers.value",
-                                            ],
-                                        },
+                        },
+                        {
+                            "nested": {
+                                "path": "identifiers",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "fields": [
+                                            "identifiers.value",
+                                        ],
                                     },
                                 },
                             },
-                            {
-                                "nested": {
-                                    "path": "tracklist",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "fields": [
-                                                "tracklist.title",
-                                            ],
-                                        },
+                        },
+                        {
+                            "nested": {
+                                "path": "tracklist",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "fields": [
+                                            "tracklist.title",
+                                        ],
                                     },
                                 },
                             },
-                            {
-                                "multi_match": {
-                                    "query": query,
-                                    "fields": [
-                                        "released.keyword^30",
-                                        "styles",
-                                    ],
-                                },
+                        },
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fields": [
+                                    "released.keyword^30",
+                                    "styles",
+                                ],
                             },
-                            {
-                                "match_phrase_prefix": {
-                                    "title": {
-                                        "query": query,
-                                        "boost": 5,
-                                    },
+                        },
+                        {
+                            "match_phrase_prefix": {
+                                "title": {
+                                    "query": query,
+                                    "boost": 5,
                                 },
                             },
-                        ],
-                    },
+                        },
+                    ],
                 },
-                "size": 100,
             },
-        )
+            "size": 100,
+            "_source": SEARCH_FIELDS,
+        },
+    )
+    return releases.body
 
-    if htmx and not htmx.boosted:
-        return render_template(
-            "search.jinja",
-            **{
-                "releases": enrich_releases(releases),
-                **request.args,
-            },
+
+class UserContext(NamedTuple):
+    user_id: int
+    discogs_user_id: int
+    username: str
+    token: dict
+    wantlist_version: int
+    hidden_version: int
+    wantlist: FrozenBitMap
+    hidden: FrozenBitMap
+
+
+def _user_context_query(column):
+    """Everything a request needs of a user, in one statement.
+
+    Bitmaps only come back if their version isn't the one the worker has
+    cached already, and the wantlist changes only with the wantlist; being
+    one statement, the changes are read consistently with their bitmap.
+    """
+    wantlist_cached = User.wantlist_version == bindparam("wantlist_version")
+    hidden_cached = User.hidden_version == bindparam("hidden_version")
+    return (
+        db.select(
+            User.user_id,
+            User.username,
+            User.discogs_oauth_token,
+            User.discogs_oauth_token_secret,
+            User.wantlist_version,
+            User.hidden_version,
+            case((wantlist_cached, null()), else_=User.wantlist).label("wantlist"),
+            case((hidden_cached, null()), else_=User.hidden).label("hidden"),
+            WantlistChange.change_id,
+            WantlistChange.release_id,
+            WantlistChange.wanted,
+        )
+        .outerjoin(
+            WantlistChange,
+            and_(WantlistChange.user_id == User.user_id, ~wantlist_cached),
         )
+        .where(column == bindparam("id"))
+        .order_by(WantlistChange.change_id)
+    )
 
-    return render_template(
-        "filter.jinja",
-        **{
-            "releases": enrich_releases(releases),
-            **request.args,
+
+# built once, so every request reuses the compiled statement and the prepared one
+USER_BY_ID = _user_context_query(User.user_id)
+USER_BY_DISCOGS_ID = _user_context_query(User.discogs_user_id)
+
+
+async def current_user():
+    """The logged in user's ``UserContext``, loaded once per request."""
+    if "user_context" not in flask.g:
+        with timings.timed("user"):
+            flask.g.user_context = await _load_user_context()
+    return flask.g.user_context
+
+
+async def current_user_id():
+    """The user's internal id, from the session unless it predates keeping it there."""
+    if "user_id" in session:
+        return session["user_id"]
+    return (await current_user()).user_id
+
+
+async def _load_user_context(*, use_cache=True):
+    discogs_user_id = session["user"]["id"]
+    wantlist_known = wantlist_cache.peek(discogs_user_id) if use_cache else None
+    hidden_known = hidden_cache.peek(discogs_user_id) if use_cache else None
+    by_id = "user_id" in session
+    rows = await db_execute(
+        USER_BY_ID if by_id else USER_BY_DISCOGS_ID,
+        {
+            "id": session["user_id"] if by_id else discogs_user_id,
+            # versions start at 0, -1 asks for the bitmaps
+            "wantlist_version": -1 if wantlist_known is None else wantlist_known,
+            "hidden_version": -1 if hidden_known is None else hidden_known,
+        },
+    )
+    if not rows:
+        session.clear()
+        raise LoggedOutError
+    user = rows[0]
+    if not by_id:
+        session["user_id"] = user.user_id
+
+    wantlist = wantlist_cache.get(discogs_user_id, user.wantlist_version)
+    hidden = hidden_cache.get(discogs_user_id, user.hidden_version)
+    if (wantlist is None and user.wantlist_version == wantlist_known) or (
+        hidden is None and user.hidden_version == hidden_known
+    ):
+        # evicted since the peek, after the statement left it out
+        return await _load_user_context(use_cache=False)
+
+    wantlist_version = user.wantlist_version
+    if wantlist is None:
+        changes = [(r.change_id, r.release_id, r.wanted) for r in rows if r.change_id is not None]
+        wantlist_version, wantlist = await blocking(
+            _fold_wantlist,
+            discogs_user_id,
+            user.user_id,
+            wantlist_version,
+            user.wantlist,
+            changes,
+        )
+    if hidden is None:
+        bitmap = user.hidden
+        if bitmap is None:
+            bitmap = await blocking(_rebuild_hidden, user.user_id, user.hidden_version)
+        hidden = FrozenBitMap.deserialize(bitmap)
+        hidden_cache.put(discogs_user_id, user.hidden_version, hidden, len(bitmap))
+
+    return UserContext(
+        user_id=user.user_id,
+        discogs_user_id=discogs_user_id,
+        username=user.username,
+        token={
+            "oauth_token": user.discogs_oauth_token,
+            "oauth_token_secret": user.discogs_oauth_token_secret,
         },
+        wantlist_version=wantlist_version,
+        hidden_version=user.hidden_version,
+        wantlist=wantlist,
+        hidden=hidden,
     )
 
 
-def load_wantlist():
-    if "user" in session:
-        bitmap = db.session.scalar(
-            db.select(User.wantlist).where(
-                User.discogs_user_id == session.get("user").get("id"),
+async def load_wantlist():
+    if "user" not in session:
+        return FrozenBitMap()
+    return (await current_user()).wantlist
+
+
+def _fold_wantlist(discogs_user_id, user_id, version, bitmap, changes):
+    """Apply ``changes`` to the stored ``bitmap`` and cache the result.
+
+    Folds the changes into the stored bitmap once there are enough of them,
+    returns the version the wantlist ends up at along with it.
+    """
+    # frozen so callers cannot mutate the cached copy
+    wantlist = FrozenBitMap(apply_wantlist_changes(bitmap, changes))
+    if len(changes) >= WANTLIST_COMPACT_AFTER:
+        bitmap = BitMap.serialize(wantlist)
+        if compact_wantlist(user_id, version, bitmap, changes[-1][0]):
+            version += 1
+    wantlist_cache.put(discogs_user_id, version, wantlist, len(bitmap or b""))
+    return version, wantlist
+
+
+def apply_wantlist_changes(bitmap, changes):
+    wantlist = BitMap.deserialize(bitmap) if bitmap else BitMap()
+    for _, release_id, wanted in changes:
+        if wanted:
+            wantlist.add(release_id)
+        else:
+            wantlist.discard(release_id)
+    return wantlist
+
+
+def record_want(user_id, release_id, *, wanted):
+    """Append one want or unwant, without rewriting the user's whole bitmap."""
+    # the version bump locks the user row first, so change ids follow version order
+    db.session.execute(
+        update(User)
+        .where(User.user_id == user_id)
+        .values(wantlist_version=User.wantlist_version + 1),
+    )
+    db.session.execute(
+        insert(WantlistChange).values(
+            user_id=user_id,
+            release_id=int(release_id),
+            wanted=wanted,
+        ),
+    )
+    db.session.commit()
+
+
+def compact_wantlist(user_id, version, bitmap, last_change_id):
+    """Store ``bitmap``, the wantlist at ``version``, and drop the changes it folds in.
+
+    Gives up if anything changed since ``version`` was read, the next load
+    tries again. So it does while a sync runs: the sync puts the changes made
+    since it started on top of what it fetched, those folded away would be lost.
+    """
+    syncing = exists().where(
+        WantlistSync.user_id == user_id,
+        WantlistSync.state == "running",
+        WantlistSync.heartbeat >= time.time() - WANTLIST_SYNC_STALE,
+    )
+    result = db.session.execute(
+        update(User)
+        .where(User.user_id == user_id, User.wantlist_version == version, ~syncing)
+        .values(wantlist=bitmap, wantlist_version=User.wantlist_version + 1),
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return False
+    db.session.execute(
+        delete(WantlistChange).where(
+            WantlistChange.user_id == user_id,
+            WantlistChange.change_id <= last_change_id,
+        ),
+    )
+    db.session.commit()
+    return True
+
+
+async def load_hidden():
+    """The user's ``(hidden_version, hidden)``, including hides not flushed yet."""
+    if "user" not in session:
+        return 0, FrozenBitMap()
+
+    user = await current_user()
+    hidden = user.hidden
+    pending = hides.pending(user.discogs_user_id)
+    if pending:
+        hidden = hidden | BitMap(pending)
+    return user.hidden_version, hidden
+
+
+def _rebuild_hidden(user_id, version):
+    """Store the hidden set, not materialized yet or invalidated by a conflicting write."""
+    hidden = BitMap(
+        db.session.scalars(
+            db.select(Action.identifier).where(
+                Action.action == "HIDE",
+                Action.user_id == user_id,
             ),
+        ),
+    )
+    bitmap = BitMap.serialize(hidden)
+    db.session.execute(
+        update(User)
+        .where(User.user_id == user_id, User.hidden_version == version)
+        .values(hidden=bitmap),
+    )
+    db.session.commit()
+    return bitmap
+
+
+def flush_hides(batch):
+    hidden = {}
+    for discogs_user_id, release_id in batch:
+        hidden.setdefault(discogs_user_id, BitMap()).add(release_id)
+
+    with app.app_context():
+        users = db.session.execute(
+            db.select(User.user_id, User.discogs_user_id, User.hidden)
+            .where(User.discogs_user_id.in_(hidden))
+            .with_for_update(),
+        ).all()
+        if not users:
+            return
+        db.session.execute(
+            insert(Action)
+            .values(
+                [
+                    {"user_id": user_id, "action": "HIDE", "identifier": release_id}
+                    for user_id, discogs_user_id, _ in users
+                    for release_id in hidden[discogs_user_id]
+                ],
+            )
+            .on_conflict_do_nothing(),
         )
-        if bitmap:
-            return BitMap.deserialize(bitmap)
-    return []
+        # the rows are locked, so the bitmaps can be merged in place
+        for user_id, discogs_user_id, bitmap in users:
+            values = {"hidden_version": User.hidden_version + 1}
+            if bitmap is not None:
+                merged = BitMap.deserialize(bitmap) | hidden[discogs_user_id]
+                values["hidden"] = BitMap.serialize(merged)
+            db.session.execute(update(User).where(User.user_id == user_id).values(values))
+        db.session.commit()
+
+
+# hides are acknowledged right away and written in batches, reads on this
+# worker merge in the pending ones; other workers see them once flushed
+hides = WriteBehind(
+    flush_hides,
+    max_batch=int(os.environ.get("HIDE_BATCH_SIZE", "200")),
+    max_delay=float(os.environ.get("HIDE_BATCH_DELAY", "1")),
+)
 
 
-def enrich_releases(releases):
-    wantlist = load_wantlist()
+def session_key():
+    if "user" in session:
+        return session["user"]["id"]
+    # not the address, visitors behind one proxy or NAT would cancel each other's searches
+    if "visitor" not in session:
+        session["visitor"] = secrets.token_urlsafe(16)
+    return "visitor/" + session["visitor"]
+
+
+def enrich_releases(releases, wantlist):
     return (
         [
             {
@@ -387,75 +971,16 @@ def enrich_releases(releases):
 
 
 @app.route("/by_label")
-def by_label():
+@fragment_cached
+async def by_label():
     query = request.args.get("search")
-    labels = []
+    results = []
 
     if query:
-        labels = es_client.search(
-            index="releases",
-            body={
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "nested": {
-                                    "path": "labels",
-                                    "query": {
-                                        "multi_match": {
-                                            "query": query,
-                                            "type": "bool_prefix",
-                                            "fields": [
-                                                "labels.name",
-                                            ],
-                                        },
-                                    },
-                                },
-                            },
-                        ],
-                    },
-                },
-                "aggs": {
-                    "labels": {
-                        "nested": {
-                            "path": "labels",
-                        },
-                        "aggs": {
-                            "name": {
-                                "terms": {
-                                    "field": "labels.name.keyword",
-                                    "size": 50,
-                                },
-                                "aggs": {
-                                    "id": {
-                                        "top_hits": {
-                                            "size": 1,
-                                            "_source": {
-                                                "includes": ["labels.id"],
-                                            },
-                                        },
-                                    },
-                                },
-                            },
-                        },
-                    },
-                },
-                "size": 100,
-            },
-        )
-
-    results = (
-        (
-            {
-                "doc_count": label["doc_count"],
-                "key": label["key"],
-                "id": label["id"]["hits"]["hits"][0]["_source"]["id"],
-            }
-            for label in labels["aggregations"]["labels"]["name"]["buckets"]
-        )
-        if labels
-        else []
-    )
+        results = [
+            {"doc_count": doc_count, "key": name, "id": label_id}
+            for label_id, name, doc_count, _ in label_names.search(query, limit=50)
+        ] or await label_search(query)
 
     if htmx and not htmx.boosted:
         return render_template(
@@ -475,9 +1000,72 @@ def by_label():
     )
 
 
+async def label_search(query):
+    labels = await es_search(
+        index="releases",
+        body={
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "nested": {
+                                "path": "labels",
+                                "query": {
+                                    "multi_match": {
+                                        "query": query,
+                                        "type": "bool_prefix",
+                                        "fields": [
+                                            "labels.name",
+                                        ],
+                                    },
+                                },
+                            },
+                        },
+                    ],
+                },
+            },
+            "aggs": {
+                "labels": {
+                    "nested": {
+                        "path": "labels",
+                    },
+                    "aggs": {
+                        "name": {
+                            "terms": {
+                                "field": "labels.name.keyword",
+                                "size": 50,
+                            },
+                            "aggs": {
+                                "id": {
+                                    "top_hits": {
+                                        "size": 1,
+                                        "_source": {
+                                            "includes": ["labels.id"],
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+            "size": 100,
+        },
+    )
+    return [
+        {
+            "doc_count": label["doc_count"],
+            "key": label["key"],
+            "id": label["id"]["hits"]["hits"][0]["_source"]["id"],
+        }
+        for label in labels["aggregations"]["labels"]["name"]["buckets"]
+    ]
+
+
 @app.route("/label/<label_id>")
-def label(label_id):
-    releases = es_client.search(
+@fragment_cached
+async def label(label_id):
+    releases = await es_search(
         index="releases",
         body={
             "query": {
@@ -499,56 +1087,33 @@ def label(label_id):
                 },
             },
             "sort": [{"released": {"order": "asc"}}],
+            "_source": RELEASE_SMALL_FIELDS,
         },
         size=500,
     )
 
     return render_template(
         "by_artist/releases.jinja",
-        releases=enrich_releases(releases),
+        releases=enrich_releases(releases, await load_wantlist()),
     )
 
 
 @app.route("/by_artist")
-def by_artist():
+async def by_artist():
     query = request.args.get("search")
     artists = []
 
     if query:
-        artists = es_client.search(
-            index="artists",
-            body={
-                "query": {
-                    "bool": {
-                        "must": [
-                            {
-                                "multi_match": {
-                                    "type": "bool_prefix",
-                                    "operator": "and",
-                                    "max_expansions": 200,
-                                    "fields": [
-                                        "name",
-                                        "name.folded",
-                                        "namevariations",
-                                        "namevariations.folded",
-                                        "realname",
-                                        "realname.folded",
-                                    ],
-                                    "query": query,
-                                },
-                            },
-                        ],
-                    },
-                },
-                "size": 100,
-            },
-        )
+        artists = [
+            {"id": artist_id, "name": name, "profile": profile}
+            for artist_id, name, _, profile in artist_names.search(query)
+        ] or await artist_search(query)
 
     if htmx and not htmx.boosted:
         return render_template(
             "by_artist/results.jinja",
             **{
-                "artists": [{"id": r["_id"], **r["_source"]} for r in artists["hits"]["hits"]],
+                "artists": artists,
                 **request.args,
             },
         )
@@ -556,134 +1121,376 @@ def by_artist():
     return render_template(
         "by_artist.jinja",
         **{
-            "artists": [{"id": r["_id"], **r["_source"]} for r in artists["hits"]["hits"]]
-            if artists
-            else [],
+            "artists": artists,
             **request.args,
         },
     )
 
 
-@app.post("/want")
-def want():
-    release_id = request.form.get("release_id")
-
-    if not release_id or "user" not in session:
-        return flask_htmx.make_response(redirect="/login")
-
-    username = session["user"]["username"]
-
-    wants = oauth.discogs.put(
-        f"https://api.discogs.com/users/{username}/wants/{release_id}",
-        timeout=5,
+async def artist_search(query):
+    artists = await es_search(
+        index="artists",
+        body={
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "multi_match": {
+                                "type": "bool_prefix",
+                                "operator": "and",
+                                "max_expansions": 200,
+                                "fields": [
+                                    "name",
+                                    "name.folded",
+                                    "namevariations",
+                                    "namevariations.folded",
+                                    "realname",
+                                    "realname.folded",
+                                ],
+                                "query": query,
+                            },
+                        },
+                    ],
+                },
+            },
+            "size": 100,
+        },
     )
-    wants.raise_for_status()
+    return [{"id": r["_id"], **r["_source"]} for r in artists["hits"]["hits"]]
 
-    wants = load_wantlist()
 
-    wants.add(int(release_id))
-
-    stmt = (
-        update(User)
-        .where(User.discogs_user_id == session.get("user").get("id"))
-        .values(wantlist=BitMap.serialize(wants))
-    )
-    db.session.execute(stmt)
-    db.session.commit()
+@app.post("/want")
+async def want():
+    return await change_want(wanted=True)
 
-    release = es_client.get(index="releases", id=release_id)
 
-    return render_template(
-        "discover/wanted.jinja",
-        release={**release["_source"], "id": release["_id"], "wanted": True},
-        update_small=True,
-    )
+@app.post("/unwant")
+async def unwant():
+    return await change_want(wanted=False)
 
 
-@app.post("/unwant")
-def unwant():
+async def change_want(*, wanted):
+    """Change the local wantlist and leave the Discogs call to the outbox."""
     release_id = request.form.get("release_id")
 
     if not release_id or "user" not in session:
         return flask_htmx.make_response(redirect="/login")
 
-    username = session["user"]["username"]
+    user = session["user"]
+    await blocking(record_want, await current_user_id(), release_id, wanted=wanted)
+    await blocking(discogs_outbox.put, user["id"], user["username"], int(release_id), wanted=wanted)
+    prefetches.invalidate(session_key())
 
-    wants = oauth.discogs.delete(
-        f"https://api.discogs.com/users/{username}/wants/{release_id}",
-        timeout=10,
+    return render_template(
+        "discover/wanted.jinja" if wanted else "discover/unwanted.jinja",
+        release={**await release_small(release_id), "id": release_id, "wanted": wanted},
+        update_small=True,
+        outbox=await blocking(discogs_outbox.status, user["id"]),
     )
-    wants.raise_for_status()
 
-    wants = load_wantlist()
 
-    wants.remove(int(release_id))
+async def release_small(release_id):
+    """The ``RELEASE_SMALL_FIELDS`` of a release, mostly left in the cache by its pane."""
+    key = f"release-small/{release_id}"
+    release = await blocking(cache.get, key)
+    if release is None:
+        release = await es_get(
+            index="releases",
+            id=release_id,
+            source_includes=RELEASE_SMALL_FIELDS,
+        )
+        release = release["_source"]
+        await blocking(cache.set, key, release, timeout=RELEASE_SMALL_TIMEOUT)
+    return release
 
-    stmt = (
-        update(User)
-        .where(User.discogs_user_id == session.get("user").get("id"))
-        .values(wantlist=BitMap.serialize(wants))
-    )
-    db.session.execute(stmt)
-    db.session.commit()
 
-    release = es_client.get(index="releases", id=release_id)
+@timings.timed("facets")
+def get_filters():
+    return facets.get()
 
-    return render_template(
-        "discover/unwanted.jinja",
-        release={**release["_source"], "id": release["_id"], "wanted": False},
-        update_small=True,
-    )
 
+def fetch_filters():
+    filters = axum_sync().get("filters", timeout=20)
+    filters.raise_for_status()
+    filters = filters.json().get("aggregations")
+    keys = sorted(filters, key=lambda f: len(filters[f]["buckets"]))
+    return {k: filters[k] for k in keys}
 
-@cache.cached(timeout=9000, key_prefix="filters")
-def get_filters():
-    with httpx.Client() as client:
-        filters = client.get(f"{AXUM_API}filters", timeout=20)
-        filters.raise_for_status()
-        filters = filters.json().get("aggregations")
-        keys = sorted(filters, key=lambda f: len(filters[f]["buckets"]))
-        return {k: filters[k] for k in keys}
+
+# the aggregation takes seconds, every worker on the host shares one copy of it
+facets = SharedValue(
+    os.environ.get("FACET_CACHE_PATH", Path(app.instance_path) / "facets.json"),
+    fetch_filters,
+    fresh=int(os.environ.get("FACET_CACHE_TIMEOUT", "9000")),
+)
 
 
 async def get_releases(
     params: werkzeug.datastructures.MultiDict,
+    source,
     *,
     omit_hidden=True,
+    prefetch=False,
 ):
+    listing = filter_key(params)
+    cursor = decode_cursor(params.get("cursor"))
+    if cursor is None or cursor["listing"] != listing:
+        cursor = {"pit": None, "sort": None, "page": 0, "size": None}
+
     page_size = int(params.get("pageSize", 5))
+    # infinite scroll only sends the cursor, which knows the page it came from
     offset = int(
-        params.get("offset", (int(params.get("page", 1)) - 1) * page_size),
+        params.get("offset", (int(params.get("page", cursor["page"] + 1)) - 1) * page_size),
     )
     page = 1 + offset // page_size
 
-    actions = []
-    if "user" in session and omit_hidden:
-        actions = db.session.scalars(
-            db.select(Action.identifier).where(
-                Action.action == "HIDE",
-                Action.user_id
-                == db.select(User.user_id)
-                .scalar_subquery()
-                .where(User.discogs_user_id == session.get("user").get("id")),
+    hidden_version, hidden = await load_hidden() if omit_hidden else (0, FrozenBitMap())
+    filters = release_filters(params)
+
+    search_after = (
+        cursor["sort"]
+        if cursor["pit"] and cursor["page"] == page - 1 and cursor["size"] == page_size
+        else None
+    )
+    if search_after is None and offset + page_size > MAX_RESULT_WINDOW:
+        # from/size can't go past the result window, only the cursor can step deeper
+        offset = MAX_RESULT_WINDOW - page_size
+        page = 1 + offset // page_size
+
+    prefetched = prefetches.take(
+        session_key(),
+        (listing, tuple(source), hidden_version, page, page_size, params.get("cursor")),
+    )
+    # hides change the total, so it's per user unless nothing is hidden
+    total_key = f"total/{listing}/" + (f"{session_key()}/{hidden_version}" if hidden else "-")
+    total = await cached_total(total_key)
+
+    opened = None
+
+    async def search(pit, after):
+        nonlocal opened
+        if not pit and page > 1:
+            # only open a point in time once the user starts paging
+            pit = opened = await open_pit()
+        return await fetch_releases(
+            filters,
+            source,
+            hidden,
+            pit=pit,
+            search_after=after,
+            offset=offset,
+            size=page_size,
+            count=total is None,
+        )
+
+    async def fetch():
+        releases = await prefetched_page(prefetched, total)
+        if releases is not None:
+            return releases
+        try:
+            return await search(cursor["pit"], search_after)
+        except PitExpiredError:
+            app.logger.info("point in time of listing %s is gone, paging in a new one", listing)
+            # from/size finds the page exactly within the result window, past it the
+            # sort values seek to about the same place in the new point in time
+            within = offset + page_size <= MAX_RESULT_WINDOW
+            return await search(None, None if within else search_after)
+
+    # the wantlist isn't needed until the results are in, load it meanwhile
+    releases, wantlist = await asyncio.gather(fetch(), load_wantlist())
+
+    if total is None:
+        # ES counts up to 10,000 matches and reports "gte" for more
+        total = releases["hits"]["total"]
+        await cache_total(total_key, total)
+    hits = int(total["value"])
+    pit = releases.get("pit_id", opened or cursor["pit"])
+    remember_pit(listing, pit, opened=opened is not None)
+    last_sort = releases["hits"]["hits"][-1].get("sort") if releases["hits"]["hits"] else None
+
+    next_cursor = encode_cursor(
+        {
+            "listing": listing,
+            # sort values only line up with later searches if they came from the pit
+            "pit": pit,
+            "sort": last_sort if pit else None,
+            "page": page,
+            "size": page_size,
+        },
+    )
+
+    if prefetch and offset + page_size < hits:
+        prefetch_page(
+            (listing, tuple(source), hidden_version, page + 1, page_size, next_cursor),
+            filters,
+            source,
+            hidden,
+            # never opens a point in time, most first pages are all a visitor looks at
+            pit=pit,
+            search_after=last_sort if pit else None,
+            offset=offset + page_size,
+            size=page_size,
+        )
+
+    return {
+        "releases": enrich_releases(releases, wantlist),
+        "page": page,
+        "pageSize": page_size,
+        "from": offset,
+        "hits": hits,
+        "hits_approx": total["relation"] != "eq",
+        "next_cursor": next_cursor,
+    }
+
+
+def prefetch_page(key, filters, source, hidden, *, pit, search_after, offset, size):  # noqa: PLR0913
+    """Start fetching the page the next click asks for, the same way that request would."""
+    if search_after is None and offset + size > MAX_RESULT_WINDOW:
+        return
+    prefetches.start(
+        session_key(),
+        key,
+        aio.submit(
+            fetch_releases(
+                filters,
+                source,
+                hidden,
+                pit=pit,
+                search_after=search_after,
+                offset=offset,
+                size=size,
+                count=not TOTAL_CACHE_TIMEOUT,
             ),
-        ).all()
+        ),
+    )
+
+
+async def prefetched_page(prefetched, total):
+    """The page prefetched for this request, unless it failed or lacks the total."""
+    if prefetched is None:
+        return None
+    try:
+        releases = await asyncio.wrap_future(prefetched)
+    except Exception:
+        app.logger.warning("prefetched page failed, fetching it again", exc_info=True)
+        return None
+    # prefetches don't count the matches, of no use if the total has expired since
+    if total is None and "total" not in releases["hits"]:
+        return None
+    return releases
+
+
+async def cached_total(key):
+    if not TOTAL_CACHE_TIMEOUT:
+        return None
+    return await blocking(cache.get, key)
+
+
+async def cache_total(key, total):
+    if TOTAL_CACHE_TIMEOUT:
+        await blocking(cache.set, key, total, timeout=TOTAL_CACHE_TIMEOUT)
+
+
+async def fetch_releases(  # noqa: PLR0913
+    filters,
+    source,
+    hidden,
+    *,
+    pit,
+    search_after,
+    offset,
+    size,
+    count=True,
+):
+    """Search releases through axum, in the point in time ``pit`` if one is given.
 
+    Only the ``source`` fields of each release are returned, and
+    ``count=False`` leaves out the total. Raises ``PitExpiredError`` once
+    ``pit`` has expired or was closed.
+    """
     params = [
+        *filters,
+        *[("source", field) for field in source],
+        *([("pit", pit)] if pit else []),
+        *([("search_after", json.dumps(search_after))] if search_after else []),
+        ("from", 0 if search_after else offset),
+        ("size", size),
+        *([] if count else [("track_total_hits", "false")]),
+    ]
+
+    # hidden ids go in the body, the query string can't hold a large bitmap
+    with timings.timed("axum"):
+        releases = await aio.run(
+            axum().post(
+                "releases",
+                params=params,
+                content=BitMap.serialize(hidden) if hidden else b"",
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=10,
+            ),
+        )
+    try:
+        body = releases.json()
+    except ValueError:
+        releases.raise_for_status()
+        raise
+    if pit and pit_missing(body):
+        raise PitExpiredError(pit)
+    releases.raise_for_status()
+    if "error" in body:
+        # axum used to pass ES errors on as a 200
+        msg = f"release search failed: {body['error']}"
+        raise RuntimeError(msg)
+    return body
+
+
+def pit_missing(body):
+    """Whether ES failed a search because its point in time is gone."""
+    error = body.get("error")
+    if not isinstance(error, dict):
+        return False
+    causes = [error, error.get("caused_by") or {}, *error.get("root_cause", [])]
+    return any(cause.get("type") == "search_context_missing_exception" for cause in causes)
+
+
+async def open_pit():
+    return (await es_open_point_in_time(index="releases", keep_alive=PIT_KEEP_ALIVE))["id"]
+
+
+def remember_pit(listing, pit, *, opened):
+    """Keep the session's point in time for ``listing``, closing those it stopped paging.
+
+    A session keeps one per listing, for the SESSION_PITS listings it paged
+    last. Only a newly ``opened`` one replaces the listing's earlier point in
+    time; otherwise ``pit`` is the id ES handed back for it, which may change
+    from one search to the next.
+    """
+    if not pit:
+        return
+    remembered = session.get("pits", [])
+    closing = [old for key, old in remembered if key == listing and old != pit and opened]
+    pits = [[key, old] for key, old in remembered if key != listing] + [[listing, pit]]
+    closing += [old for _, old in pits[:-SESSION_PITS]]
+    pits = pits[-SESSION_PITS:]
+    if pits != remembered:
+        session["pits"] = pits
+    for old in closing:
+        aio.submit(close_pit(old))
+
+
+async def close_pit(pit):
+    try:
+        await es_close_point_in_time(id=pit)
+    except elasticsearch.NotFoundError:
+        pass
+    except Exception:
+        app.logger.warning("closing a point in time failed", exc_info=True)
+
+
+def release_filters(params):
+    return [
         p
         for p in [
-            (
-                (
-                    "hide",
-                    base64.urlsafe_b64encode(
-                        BitMap.serialize(BitMap(actions)),
-                    ).decode(
-                        "UTF-8",
-                    ),
-                )
-                if actions
-                else None
-            ),
             params.get("label") and ("field", "nested:labels.name"),
             params.get("label") and ("value", params["label"]),
             params.get("song") and ("field", "nested:tracklist.title"),
@@ -705,9 +1512,6 @@ async def get_releases(
             ),
             ("field", "nested:identifiers.value") if params.get("identifier") else None,
             ("value", params.get("identifier")) if params.get("identifier") else None,
-            ("search_after", params.get("search_after")),
-            ("from", offset),
-            ("size", page_size),
             (
                 "videos_only",
                 "true" if params.get("videos_only") == "on" else "false",
@@ -752,26 +1556,36 @@ async def get_releases(
         if p
     ]
 
-    async with httpx.AsyncClient() as client:
-        releases = await client.get(
-            f"{AXUM_API}releases",
-            params=params,
-            timeout=10,
-        )
-        releases.raise_for_status()
-        releases = releases.json()
 
-        hits = int(releases["hits"]["total"]["value"])
+def filter_key(params):
+    """Identify a listing by its filters, ignoring paging."""
+    filters = sorted((k, v) for k, v in params.items(multi=True) if k not in PAGING_PARAMS)
+    return hashlib.blake2b(json.dumps(filters).encode(), digest_size=8).hexdigest()
 
-        releases = enrich_releases(releases)
 
-        return {
-            "releases": releases,
-            "page": page,
-            "pageSize": page_size,
-            "from": offset,
-            "hits": hits,
-        }
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+# what each field of a cursor may hold, None included
+CURSOR_FIELDS = {"listing": str, "pit": str, "sort": list, "page": int, "size": int}
+
+
+def decode_cursor(value):
+    """The cursor in ``value``, None unless it is one ``encode_cursor`` could have made."""
+    if not value:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value))
+    except ValueError:
+        return None
+    if not isinstance(cursor, dict) or cursor.keys() != CURSOR_FIELDS.keys():
+        return None
+    if cursor["page"] is None or not all(
+        v is None or isinstance(v, CURSOR_FIELDS[k]) for k, v in cursor.items()
+    ):
+        return None
+    return cursor
 
 
 @app.post("/hide")
@@ -785,23 +1599,15 @@ async def hide():
         int(request.form.get("from", 0)) + int(request.form.get("pageSize", 5)) - 1,
     )
 
-    action = Action(
-        user_id=db.select(User.user_id)
-        .scalar_subquery()
-        .where(User.discogs_user_id == session.get("user").get("id")),
-        action="HIDE",
-        identifier=request.form.get("release_id"),
-    )
-
-    db.session.add(action)
-    db.session.commit()
+    hides.put(session.get("user").get("id"), int(request.form.get("release_id")))
+    prefetches.invalidate(session_key())
 
     return ""
 
 
 @app.route("/artist/<artist_id>")
-def artist(artist_id):
-    artist = es_client.get(index="artists", id=artist_id)
+async def artist(artist_id):
+    artist = await es_get(index="artists", id=artist_id)
     artist = {**artist["_source"], "id": artist["_id"]}
     return render_template(
         "by_artist/artist.jinja",
@@ -823,8 +1629,13 @@ def es_helper_nested_terms(path, field, values):
 
 
 @app.route("/artist/<artist_id>/releases")
-def artist_releases(artist_id):
-    artist = es_client.get(index="artists", id=artist_id)
+@fragment_cached
+async def artist_releases(artist_id):
+    artist = await es_get(
+        index="artists",
+        id=artist_id,
+        source_includes=["groups.id", "aliases.id"],
+    )
     artist = {**artist["_source"], "id": artist["_id"]}
 
     all_possible_ids = [
@@ -833,7 +1644,7 @@ def artist_releases(artist_id):
         *[a["id"] for a in artist.get("aliases", [])],
     ]
 
-    releases = es_client.search(
+    releases = await es_search(
         index="releases",
         body={
             "query": {
@@ -894,24 +1705,34 @@ def artist_releases(artist_id):
                 },
             },
             "sort": [{"released": {"order": "asc"}}],
+            "_source": RELEASE_SMALL_FIELDS,
         },
         size=100,
     )
 
     return render_template(
         "by_artist/releases.jinja",
-        releases=enrich_releases(releases),
+        releases=enrich_releases(releases, await load_wantlist()),
     )
 
 
 @app.route("/release/<release_id>")
-def release(release_id):
-    release = es_client.get(index="releases", id=release_id)
+@fragment_cached
+async def release(release_id):
+    release = await es_get(index="releases", id=release_id, source_includes=DISCOVER_FIELDS)
+    # the pane is where want buttons are, keep what re-rendering a click needs at hand
+    small = {field.split(".")[0] for field in RELEASE_SMALL_FIELDS}
+    await blocking(
+        cache.set,
+        f"release-small/{release_id}",
+        {field: value for field, value in release["_source"].items() if field in small},
+        timeout=RELEASE_SMALL_TIMEOUT,
+    )
 
     release = {
         **release["_source"],
         "id": release["_id"],
-        "wanted": int(release["_id"]) in load_wantlist(),
+        "wanted": int(release["_id"]) in await load_wantlist(),
     }
     return render_template(
         "discover/release.jinja",
@@ -919,19 +1740,35 @@ def release(release_id):
     )
 
 
+@app.route("/release/<release_id>/json")
+@fragment_cached
+async def release_json(release_id):
+    """The whole document of a release, for the JSON panel of its pane."""
+    release = await es_get(index="releases", id=release_id)
+    return render_template(
+        "discover/release-json.jinja",
+        release={**release["_source"], "id": release["_id"]},
+    )
+
+
 @app.route("/thumb/<release_id>")
 def thumb(release_id):
     if "user" not in session:
         raise LoggedOutError
 
-    req = oauth.discogs.get(
-        f"https://api.discogs.com/releases/{release_id}",
-        timeout=3,
-    )
+    # read now, a stale entry is refetched in the background outside the request
+    token = get_token()
 
-    req.raise_for_status()
+    def fetch():
+        req = oauth.discogs.get(
+            f"{DISCOGS_API}/releases/{release_id}",
+            token=token,
+            timeout=3,
+        )
+        req.raise_for_status()
+        return req.json()
 
-    thumb = req.json().get("thumb")
+    thumb = discogs_cache.get_or_fetch("release", release_id, fetch).get("thumb")
     if not thumb:
         return "", 404
 
@@ -946,33 +1783,87 @@ def thumb(release_id):
     return resp
 
 
+@app.route("/thumbs")
+def thumbs():
+    if "user" not in session:
+        raise LoggedOutError
+
+    token = get_token()
+
+    def fetch(release_id):
+        req = oauth.discogs.get(
+            f"{DISCOGS_API}/releases/{release_id}",
+            token=token,
+            timeout=3,
+        )
+        req.raise_for_status()
+        return req.json()
+
+    releases = discogs_cache.get_or_fetch_many(
+        "release",
+        request.args.getlist("id")[:100],
+        fetch,
+    )
+
+    return render_template(
+        "thumbs.jinja",
+        thumbs={k: r["thumb"] for k, r in releases.items() if r.get("thumb")},
+    )
+
+
 @app.route("/prices/<release_id>")
 def get_price(release_id):
     if "user" not in session or oauth.discogs is None:
         raise LoggedOutError
 
-    prices = oauth.discogs.get(
-        f"https://api.discogs.com/marketplace/price_suggestions/{release_id}",
-        timeout=10,
-    ).json()
+    token = get_token()
 
-    if prices == {}:
-        # look up price of master release
-        release = httpx.get(
-            f"{AXUM_API}release?id={release_id}",
-            timeout=5,
-        ).json()["_source"]
-        if "master_id" in release and release["master_id"]["is_main_release"] == "false":
-            prices = oauth.discogs.get(
-                f"https://api.discogs.com/marketplace/price_suggestions/{release['master_id']['#text']}",
-                timeout=5,
-            ).json()
+    def fetch(release_id):
+        resp = oauth.discogs.get(
+            f"{DISCOGS_API}/marketplace/price_suggestions/{release_id}",
+            token=token,
+            timeout=10,
+        )
+        # only a suggestion, or an empty one, is worth caching
+        if 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):  # noqa: PLR2004
+            try:
+                msg = resp.json()["message"]
+            except (ValueError, KeyError, TypeError):
+                msg = f"Discogs answered {resp.status_code}"
+            raise DiscogsRejectedError(msg)
+        resp.raise_for_status()
+        return resp.json()
+
+    def fetch_master(release_id):
+        with timings.timed("axum"):
+            release = (
+                axum_sync()
+                .get(
+                    "release",
+                    params={"id": release_id, "source": "master_id"},
+                    timeout=5,
+                )
+                .json()["_source"]
+            )
+        master = release.get("master_id", {})
+        return master.get("#text", "") if master.get("is_main_release") == "false" else ""
+
+    try:
+        # dig cards pass the master from their release document, "" when there is none
+        prices = price_service.get(
+            session["user"]["id"],
+            release_id,
+            request.args.get("master"),
+            fetch,
+            fetch_master,
+        )
+    except DiscogsRejectedError as e:
+        # e.g. seller settings the user hasn't filled in yet
+        return str(e)
 
     if prices == {}:
-        return "", 404
-
-    if "message" in prices:
-        return prices["message"]
+        # neither has suggestions, don't ask again for every card scrolled past
+        return "", 404, {"Cache-Control": "max-age=3600"}
 
     short_prices = {}
     for k in prices:
@@ -989,35 +1880,189 @@ def get_price(release_id):
     return resp
 
 
-@app.post("/wants")
-def wantlist() -> str:
-    username = session["user"]["username"]
-    bitmap = BitMap()
-    url = f"https://api.discogs.com/users/{username}/wants?per_page=100&page=1"
+def claim_wantlist_sync(user_id, progress):
+    """Take the user's sync lock, returning when the sync started or None if one runs."""
+    now = time.time()
+    stmt = insert(WantlistSync).values(
+        user_id=user_id,
+        state="running",
+        started=now,
+        heartbeat=now,
+        progress=progress,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[WantlistSync.user_id],
+        set_={
+            "state": stmt.excluded.state,
+            "started": stmt.excluded.started,
+            "heartbeat": stmt.excluded.heartbeat,
+            "progress": stmt.excluded.progress,
+        },
+        where=(WantlistSync.state != "running")
+        | (WantlistSync.heartbeat < now - WANTLIST_SYNC_STALE),
+    )
+    claimed = db.session.execute(stmt.returning(WantlistSync.user_id)).first()
+    db.session.commit()
+    return now if claimed else None
 
-    while url:
-        wants = oauth.discogs.get(
-            url,
-            timeout=60,
+
+def report_wantlist_sync(user_id, started, progress):
+    db.session.execute(
+        update(WantlistSync)
+        .where(WantlistSync.user_id == user_id, WantlistSync.started == started)
+        .values(state=progress["state"], heartbeat=time.time(), progress=progress),
+    )
+    db.session.commit()
+
+
+def wantlist_sync_progress(user_id):
+    row = db.session.execute(
+        db.select(WantlistSync.progress, WantlistSync.heartbeat).where(
+            WantlistSync.user_id == user_id,
+        ),
+    ).first()
+    if row is None:
+        return None
+    progress = row.progress
+    if progress["state"] == "running" and row.heartbeat < time.time() - WANTLIST_SYNC_STALE:
+        return {**progress, "state": "failed", "error": "the sync was interrupted"}
+    return progress
+
+
+def wantlist_snapshot(user_id):
+    """The user's wantlist and the id of the last change in it, read in one statement."""
+    rows = db.session.execute(
+        db.select(
+            User.wantlist,
+            WantlistChange.change_id,
+            WantlistChange.release_id,
+            WantlistChange.wanted,
         )
-        try:
-            wants.raise_for_status()
-        except Exception:
-            sleep(5)
-            continue
-        wants = wants.json()
-        bitmap.update(w["id"] for w in wants["wants"])
-        url = wants["pagination"]["urls"].get("next", None)
-
-    stmt = (
+        .outerjoin(WantlistChange, WantlistChange.user_id == User.user_id)
+        .where(User.user_id == user_id)
+        .order_by(WantlistChange.change_id),
+    ).all()
+    changes = [(r.change_id, r.release_id, r.wanted) for r in rows if r.change_id is not None]
+    return apply_wantlist_changes(rows[0].wantlist, changes), changes[-1][0] if changes else 0
+
+
+def save_synced_wantlist(user_id, bitmap, synced_after):
+    """Store the synced ``bitmap`` with the changes made since the sync started on top.
+
+    The sync replaces the changes up to ``synced_after``, the last one when it
+    started. Later ones, wants and unwants made while it ran, are folded into
+    what it stores rather than lost.
+    """
+    # the version bump locks the user row first, as a want does, so no change or
+    # compaction gets in between reading the later changes and storing them
+    db.session.execute(
         update(User)
-        .where(User.discogs_user_id == session.get("user").get("id"))
-        .values(wantlist=BitMap.serialize(bitmap))
+        .where(User.user_id == user_id)
+        .values(wantlist_version=User.wantlist_version + 1),
+    )
+    later = db.session.execute(
+        db.select(WantlistChange.change_id, WantlistChange.release_id, WantlistChange.wanted)
+        .where(WantlistChange.user_id == user_id, WantlistChange.change_id > synced_after)
+        .order_by(WantlistChange.change_id),
+    ).all()
+    wantlist = apply_wantlist_changes(BitMap.serialize(bitmap), later)
+    db.session.execute(
+        update(User).where(User.user_id == user_id).values(wantlist=BitMap.serialize(wantlist)),
+    )
+    db.session.execute(
+        delete(WantlistChange).where(
+            WantlistChange.user_id == user_id,
+            WantlistChange.change_id <= (later[-1].change_id if later else synced_after),
+        ),
     )
-    db.session.execute(stmt)
     db.session.commit()
 
-    return ""
+
+def start_wantlist_sync(user_id, fetch, *, delta):
+    """Sync the user's wantlist in the background, unless a sync of it already runs.
+
+    A full sync also drops wants removed on Discogs, a delta sync only adds new
+    ones. Every worker sees the progress, whichever of them runs the sync.
+    Returns False if one was already running.
+    """
+    started = None
+
+    def report(progress):
+        with app.app_context():
+            report_wantlist_sync(user_id, started, progress)
+
+    sync = wantlist_sync.WantlistSync(fetch, report=report)
+    started = claim_wantlist_sync(user_id, {**sync.progress(), "delta": delta})
+    if started is None:
+        return False
+    # read once the sync holds its row, so no compaction folds away a later change
+    known, synced_after = wantlist_snapshot(user_id)
+    if delta and known:
+        sync.known = known
+
+    def save(bitmap):
+        with app.app_context():
+            save_synced_wantlist(user_id, bitmap, synced_after)
+
+    wantlist_sync.start(sync, save)
+    return True
+
+
+@app.post("/wants")
+async def wantlist() -> str:
+    username = session["user"]["username"]
+    user = await current_user()
+
+    def fetch(page):
+        return oauth.discogs.get(
+            f"{DISCOGS_API}/users/{username}/wants",
+            params={
+                "per_page": wantlist_sync.PER_PAGE,
+                "page": page,
+                "sort": "added",
+                "sort_order": "desc",
+            },
+            token=user.token,
+            timeout=60,
+        )
+
+    await blocking(start_wantlist_sync, user.user_id, fetch, delta=not request.form.get("full"))
+    progress = await blocking(wantlist_sync_progress, user.user_id)
+    return render_template("wants/progress.jinja", progress=progress)
+
+
+@app.route("/wants/progress")
+async def wantlist_progress() -> str:
+    if "user" not in session:
+        return ""
+    progress = await blocking(wantlist_sync_progress, await current_user_id())
+    return render_template("wants/progress.jinja", progress=progress)
+
+
+@app.route("/wants/outbox")
+def wants_outbox():
+    if "user" not in session:
+        return ""
+    return render_template(
+        "wants/outbox.jinja",
+        outbox=discogs_outbox.status(session["user"]["id"]),
+    )
+
+
+@app.post("/wants/outbox/<int:entry_id>/retry")
+def retry_outbox_entry(entry_id):
+    if "user" not in session:
+        return ""
+    discogs_outbox.retry(session["user"]["id"], entry_id)
+    return wants_outbox()
+
+
+@app.post("/wants/outbox/<int:entry_id>/dismiss")
+def dismiss_outbox_entry(entry_id):
+    if "user" not in session:
+        return ""
+    discogs_outbox.dismiss(session["user"]["id"], entry_id)
+    return wants_outbox()
 
 
 @app.route("/login")
@@ -1036,7 +2081,7 @@ def logout():
 def auth():
     token = oauth.discogs.authorize_access_token()
     resp = oauth.discogs.get(
-        "https://api.discogs.com/oauth/identity",
+        f"{DISCOGS_API}/oauth/identity",
         timeout=5,
     )
     user = resp.json()
@@ -1054,9 +2099,11 @@ def auth():
             "discogs_oauth_token_secret": token["oauth_token_secret"],
         },
     )
-    db.session.execute(stmt)
+    user_id = db.session.execute(stmt.returning(User.user_id)).scalar_one()
     db.session.commit()
 
     session["user"] = user
+    # most requests only need this, it saves looking the user up
+    session["user_id"] = user_id
 
     return redirect("/")
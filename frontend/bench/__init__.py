@@ -0,0 +1 @@
+"""Offline benchmarks of the app's hot routes against local stand-ins."""
@@ -0,0 +1,182 @@
+"""Data the stand-ins serve.
+
+A fixture file is JSON with ``releases`` and ``artists`` (documents as they
+sit in the ES indices) and ``filters`` (the axum /filters aggregations).
+``record`` samples one from the real services; without one, ``generate``
+builds a deterministic synthetic set of the same shape.
+
+    python -m bench.fixtures record fixtures.json --releases 5000
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+
+STYLES = [
+    "House", "Techno", "Deep House", "Disco", "Electro", "Ambient", "Dub", "Garage House",
+    "Acid", "Minimal", "Breaks", "Downtempo", "Italo-Disco", "Jazz-Funk", "Soul", "Trance",
+]  # fmt: skip
+COUNTRIES = ["US", "UK", "Germany", "France", "Italy", "Netherlands", "Japan", "Belgium"]
+FORMATS = ["Vinyl", "CD", "File", "Cassette"]
+DESCRIPTIONS = ['12"', "LP", "EP", "Album", "33 ⅓ RPM", "45 RPM", "Compilation", "Promo"]
+WORDS = [
+    "night", "deep", "sound", "system", "love", "dance", "city", "dream", "future", "machine",
+    "space", "fire", "groove", "heart", "time", "rhythm", "light", "soul", "wave", "moon",
+]  # fmt: skip
+
+
+def _name(rng, words):
+    return " ".join(rng.choice(WORDS).title() for _ in range(words))
+
+
+def generate(releases=2000, artists=400, labels=150, seed=1):
+    rng = random.Random(seed)  # noqa: S311
+
+    artist_docs = [
+        {
+            "id": str(1000 + i),
+            "name": _name(rng, rng.randint(1, 3)),
+            "realname": _name(rng, 2),
+            "namevariations": [_name(rng, 2) for _ in range(rng.randint(0, 3))],
+            "profile": " ".join(rng.choice(WORDS) for _ in range(40)),
+            "aliases": [],
+            "groups": [],
+        }
+        for i in range(artists)
+    ]
+    for artist in artist_docs:
+        for key in ("aliases", "groups"):
+            for other in rng.sample(artist_docs, rng.randint(0, 2)):
+                artist[key].append({"id": other["id"], "#text": other["name"]})
+
+    label_docs = [{"id": str(5000 + i), "name": _name(rng, 2) + " Records"} for i in range(labels)]
+
+    def credit(artist):
+        return {"id": artist["id"], "name": artist["name"], "anv": ""}
+
+    release_docs = []
+    for i in range(releases):
+        release_artists = rng.sample(artist_docs, rng.randint(1, 2))
+        label = rng.choice(label_docs)
+        tracks = rng.randint(2, 12)
+        release_docs.append(
+            {
+                "id": str(100000 + i),
+                "title": _name(rng, rng.randint(1, 4)),
+                "released": str(rng.randint(1975, 2024)),
+                "country": rng.choice(COUNTRIES),
+                "styles": rng.sample(STYLES, rng.randint(1, 3)),
+                "genres": ["Electronic"],
+                "videos": [f"v{rng.getrandbits(40):010x}" for _ in range(rng.randint(0, 4))],
+                "notes": " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 80))),
+                "artists": [credit(a) for a in release_artists],
+                "extraartists": [credit(a) for a in rng.sample(artist_docs, rng.randint(0, 6))],
+                "labels": [
+                    {**label, "catno": f"{label['name'][:3].upper()}{rng.randint(1, 999):03}"},
+                ],
+                "formats": [
+                    {
+                        "name": rng.choice(FORMATS),
+                        "qty": "1",
+                        "text": "",
+                        "descriptions": rng.sample(DESCRIPTIONS, rng.randint(1, 3)),
+                    },
+                ],
+                "tracklist": [
+                    {
+                        "position": f"{'AB'[t * 2 // tracks]}{t + 1}",
+                        "title": _name(rng, rng.randint(1, 4)),
+                        "duration": f"{rng.randint(2, 9)}:{rng.randint(0, 59):02}",
+                        "artists": [credit(a) for a in rng.sample(artist_docs, rng.randint(0, 2))],
+                    }
+                    for t in range(tracks)
+                ],
+                "identifiers": [
+                    {"type": "Barcode", "value": str(rng.getrandbits(40))},
+                    {"type": "Matrix / Runout", "value": _name(rng, 2).upper()},
+                ],
+                "master_id": {
+                    "#text": str(900000 + i // 3),
+                    "is_main_release": str(i % 3 == 0).lower(),
+                },
+            },
+        )
+
+    return {"releases": release_docs, "artists": artist_docs, "filters": _filters(release_docs)}
+
+
+def _filters(releases):
+    fields = {
+        "Style": ("styles", lambda r: r["styles"]),
+        "Format": ("formats.name", lambda r: [f["name"] for f in r["formats"]]),
+        "Format Descriptions": (
+            "formats.descriptions",
+            lambda r: [d for f in r["formats"] for d in f["descriptions"]],
+        ),
+        "Country": ("country", lambda r: [r["country"]]),
+    }
+    filters = {}
+    for name, (field, values) in fields.items():
+        counts = {}
+        for release in releases:
+            for value in set(values(release)):
+                counts[value] = counts.get(value, 0) + 1
+        buckets = sorted(counts.items(), key=lambda kv: -kv[1])
+        filters[name] = {
+            "meta": {"field": field},
+            "buckets": [{"key": k, "doc_count": n} for k, n in buckets],
+        }
+    return filters
+
+
+def load(path):
+    with Path(path).open() as f:
+        return json.load(f)
+
+
+def record(path, releases, artists):
+    """Sample documents and facets from the services the environment points at."""
+    from elasticsearch import helpers  # noqa: PLC0415
+
+    from clients import axum_sync, es  # noqa: PLC0415
+
+    def sample(index, size):
+        docs = []
+        for hit in helpers.scan(es(), index=index, size=min(size, 1000)):
+            docs.append({**hit["_source"], "id": hit["_id"]})
+            if len(docs) >= size:
+                break
+        return docs
+
+    filters = axum_sync().get("filters", timeout=60)
+    filters.raise_for_status()
+    fixtures = {
+        "releases": sample("releases", releases),
+        "artists": sample("artists", artists),
+        "filters": filters.json()["aggregations"],
+    }
+    with Path(path).open("w") as f:
+        json.dump(fixtures, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["record", "generate"])
+    parser.add_argument("path")
+    parser.add_argument("--releases", type=int, default=2000)
+    parser.add_argument("--artists", type=int, default=400)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from dotenv import load_dotenv  # noqa: PLC0415
+
+        load_dotenv()
+        record(args.path, args.releases, args.artists)
+    else:
+        with Path(args.path).open("w") as f:
+            json.dump(generate(args.releases, args.artists), f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Compare the listings as the user's hidden set grows.
+
+Runs ``bench.run`` once per hidden set size, each in a fresh process with the
+same arguments, and prints the routes that send the hidden set to axum side
+by side. Past 65,536 ids axum splits them over several terms clauses, 200,000
+take four. Run from the frontend directory:
+
+    python -m bench.hidden --sizes 10,10000,200000 --duration 20
+"""
+
+from bench.run import sweep, sweep_parser
+
+SIZES = (10, 10000, 200000)
+# only discover leaves out what the user hid
+ROUTES = ("discover",)
+
+
+def main():
+    parser = sweep_parser(__doc__, "sizes", SIZES, duration=10)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    args, passthrough = parser.parse_known_args()
+
+    run = ["--routes", args.routes, "--duration", str(args.duration)]
+    sweep(
+        "hidden",
+        {size: (["--hidden", size, *run], {}) for size in args.sizes.split(",")},
+        passthrough,
+        [*args.routes.split(","), "mix"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Compare the ways of running async views under many simultaneous users.
+
+Runs ``bench.run`` once per ``ASYNC_VIEWS`` mode, each in a fresh process
+with the same arguments, and prints the mix phase of each side by side:
+``thread`` is Flask's loop per request as on sync workers, ``loop`` is every
+view of the worker on its one event loop. Run from the frontend directory:
+
+    python -m bench.modes --concurrency 200 --duration 30
+"""
+
+from bench.run import sweep, sweep_parser
+
+MODES = ("thread", "loop")
+
+
+def main():
+    parser = sweep_parser(__doc__, "modes", MODES, duration=20)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args, passthrough = parser.parse_known_args()
+
+    run = [
+        "--no-isolated",
+        "--concurrency",
+        str(args.concurrency),
+        "--duration",
+        str(args.duration),
+    ]
+    sweep(
+        "mode",
+        {mode: (run, {"ASYNC_VIEWS": mode}) for mode in args.modes.split(",")},
+        passthrough,
+        ["mix"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""Benchmark the hot routes against local stand-ins.
+
+Runs the app in process on SQLite, with Elasticsearch, axum and Discogs
+replaced by the servers in ``bench.stubs``. Each route is driven alone for
+``--duration`` seconds at ``--concurrency``, then all of them together in a
+weighted mix, and p50/p95/p99 latency, throughput and peak RSS are reported
+per phase. Run from the frontend directory:
+
+    python -m bench.run --save baseline.json
+    python -m bench.run --baseline baseline.json   # exits 1 on a regression
+
+The environment is passed through, so e.g. ES_CLIENT_MODE=sync benchmarks
+the blocking client and CACHE_TYPE=NullCache turns the response caches off.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import psutil
+from pyroaring import BitMap
+
+from bench import fixtures as bench_fixtures
+from bench.stubs import Stubs
+
+USER_ID = 1
+
+
+def emit(line=""):
+    print(line, flush=True)  # noqa: T201
+
+
+def configure(stubs, workdir):
+    os.environ.update(
+        {
+            "ES_URL": stubs.url("es"),
+            "AXUM_API": stubs.url("axum") + "/",
+            "DISCOGS_API": stubs.url("discogs"),
+            "DATABASE_URL": f"sqlite:///{workdir / 'bench.sqlite3'}",
+            "DISCOGS_CACHE_PATH": str(workdir / "discogs.sqlite3"),
+            "OUTBOX_PATH": str(workdir / "outbox.sqlite3"),
+            "FACET_CACHE_PATH": str(workdir / "facets.json"),
+            "NAME_INDEX": "off",
+            "DISCOGS_CLIENT_ID": "bench",
+            "DISCOGS_CLIENT_SECRET": "bench",
+        },
+    )
+    os.environ.pop("APM_SERVER_URL", None)
+
+
+def seed(app_module, data, wanted, hidden):
+    ids = [int(r["id"]) for r in data["releases"]]
+    rng = random.Random(2)  # noqa: S311
+    with app_module.app.app_context():
+        db = app_module.db
+        db.create_all()
+        db.session.add(
+            app_module.User(
+                discogs_oauth_token="bench",  # noqa: S106
+                discogs_oauth_token_secret="bench",  # noqa: S106
+                discogs_user_id=USER_ID,
+                username="bench",
+                wantlist=BitMap.serialize(BitMap(rng.sample(ids, min(wanted, len(ids))))),
+                hidden=BitMap.serialize(BitMap(rng.randrange(10**7) for _ in range(hidden))),
+            ),
+        )
+        db.session.commit()
+
+
+def scenarios(data):
+    """Map each route to a function building a random request for it."""
+    releases = data["releases"]
+    artists = data["artists"]
+    labels = [label for r in releases for label in r.get("labels", [])]
+    words = [w for r in releases[:500] for w in r["title"].lower().split()]
+    styles = [s for r in releases[:500] for s in r.get("styles", [])]
+
+    def discover(rng):
+        args = {"page": rng.randint(1, 5)}
+        if rng.random() < 0.3:  # noqa: PLR2004
+            args["styles"] = rng.choice(styles)
+        return "/discover", args
+
+    return {
+        "discover": (30, discover),
+        "dig": (15, lambda rng: ("/dig", {"page": rng.randint(1, 5), "pageSize": 5})),
+        # paging deep into one broad filter, where every page used to count the matches again
+        "browse": (
+            5,
+            lambda rng: ("/dig", {"styles": rng.choice(styles), "page": rng.randint(1, 40)}),
+        ),
+        "release": (15, lambda rng: (f"/release/{rng.choice(releases)['id']}", {})),
+        "filter": (10, lambda rng: ("/filter", {"search": " ".join(rng.sample(words, 2))})),
+        "by_artist": (8, lambda rng: ("/by_artist", {"search": rng.choice(artists)["name"][:4]})),
+        "by_label": (5, lambda rng: ("/by_label", {"search": rng.choice(labels)["name"][:4]})),
+        "label": (7, lambda rng: (f"/label/{rng.choice(labels)['id']}", {})),
+        "artist_releases": (
+            10,
+            lambda rng: (f"/artist/{rng.choice(artists)['id']}/releases", {}),
+        ),
+        "thumbs": (
+            5,
+            lambda rng: ("/thumbs", {"id": [r["id"] for r in rng.sample(releases, 10)]}),
+        ),
+        "prices": (3, lambda rng: (f"/prices/{rng.choice(releases)['id']}", {})),
+    }
+
+
+class RssSampler:
+    def __init__(self, interval=0.05):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def reset(self):
+        self.peak = self.process.memory_info().rss
+
+    def stop(self):
+        self._stop.set()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def drive(app, mix, *, concurrency, duration, logged_in, seed):  # noqa: PLR0913
+    """Send requests from ``mix`` for ``duration`` seconds, return latencies and bytes per route."""
+    names = list(mix)
+    weights = [mix[n][0] for n in names]
+    deadline = time.perf_counter() + duration
+    results = {name: {"latencies": [], "errors": 0, "bytes": 0} for name in names}
+    lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)  # noqa: S311
+        client = app.test_client()
+        if logged_in:
+            with client.session_transaction() as session:
+                session["user"] = {"id": USER_ID, "username": "bench"}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            path, args = mix[name][1](rng)
+            started = time.perf_counter()
+            response = client.get(path, query_string=args, headers={"HX-Request": "true"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                results[name]["latencies"].append(elapsed)
+                results[name]["bytes"] += len(response.data)
+                if response.status_code >= 400:  # noqa: PLR2004
+                    results[name]["errors"] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarize(latencies, errors, duration, peak_rss, *, sent, upstream=None):  # noqa: PLR0913
+    """``sent`` bytes went to the clients, ``upstream`` came from the services, if known."""
+    requests = len(latencies) or 1
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "kib_per_response": sent / requests / 1024,
+        "upstream_kib_per_request": None if upstream is None else upstream / requests / 1024,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "peak_rss_mib": peak_rss / 2**20,
+    }
+
+
+def startup(env, profile, timeout=None):
+    """Time importing the app in a fresh interpreter.
+
+    Also returns the ``profile`` slowest imports made by app.py itself, by
+    cumulative time as reported by ``-X importtime``. An import still running
+    after ``timeout`` seconds raises ``subprocess.TimeoutExpired``.
+    """
+    code = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+    out = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=timeout,
+        cwd=Path(__file__).parent.parent,
+    )
+    imports = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # nested imports are indented two more spaces per level, app's own sit one level down
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) == 3:  # noqa: PLR2004
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    imports.sort(reverse=True)
+    return float(out.stdout.strip().splitlines()[-1]), imports[:profile]
+
+
+def report(results):
+    emit(f"startup {results['startup_seconds']:.2f}s")
+    emit(f"points in time left open {results.get('open_pits', 0)}")
+    emit(
+        f"{'phase':<20}{'reqs':>7}{'errs':>6}{'rps':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rss MiB':>9}{'KiB/resp':>10}{'up KiB':>8}",
+    )
+    for name, r in results["phases"].items():
+        if not r["requests"]:
+            continue
+        upstream = r.get("upstream_kib_per_request")
+        emit(
+            f"{name:<20}{r['requests']:>7}{r['errors']:>6}{r['rps']:>9.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['peak_rss_mib']:>9.0f}"
+            f"{r.get('kib_per_response', 0):>10.1f}"
+            + (f"{upstream:>8.1f}" if upstream is not None else f"{'-':>8}"),
+        )
+
+
+def regressions(r, base, tolerance):
+    """How phase results ``r`` got worse than ``base``."""
+    problems = []
+    if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+        problems.append(f"p95 {base['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+    if r["rps"] < base["rps"] * (1 - tolerance):
+        problems.append(f"throughput {base['rps']:.1f} -> {r['rps']:.1f} rps")
+    if r["peak_rss_mib"] > base["peak_rss_mib"] * (1 + tolerance):
+        problems.append(f"peak rss {base['peak_rss_mib']:.0f} -> {r['peak_rss_mib']:.0f} MiB")
+    for key, label in (
+        ("kib_per_response", "response"),
+        ("upstream_kib_per_request", "upstream"),
+    ):
+        # results saved before bytes were counted have neither
+        if r.get(key) and base.get(key) and r[key] > base[key] * (1 + tolerance):
+            problems.append(f"{label} {base[key]:.1f} -> {r[key]:.1f} KiB per request")
+    if r["errors"] and not base["errors"]:
+        problems.append(f"{r['errors']} errors")
+    return problems
+
+
+def compare(results, baseline, tolerance):
+    """Print the phases that got worse than ``baseline`` and return whether any did."""
+    regressed = False
+    for name, r in results["phases"].items():
+        base = baseline["phases"].get(name)
+        if not base or not base["requests"] or not r["requests"]:
+            continue
+        problems = regressions(r, base, tolerance)
+        if problems:
+            regressed = True
+            emit(f"REGRESSION {name}: {', '.join(problems)}")
+    if results["startup_seconds"] > baseline["startup_seconds"] * (1 + tolerance):
+        regressed = True
+        emit(
+            f"REGRESSION startup: {baseline['startup_seconds']:.2f} -> "
+            f"{results['startup_seconds']:.2f}s",
+        )
+    return regressed
+
+
+def sweep_parser(doc, name, values, *, duration):
+    """Arguments of a script running ``bench.run`` once per value of ``--<name>``.
+
+    Arguments the parser doesn't know are left for ``bench.run``.
+    """
+    parser = argparse.ArgumentParser(description=doc.splitlines()[0])
+    parser.add_argument(f"--{name}", default=",".join(map(str, values)))
+    parser.add_argument("--duration", type=float, default=duration, help="seconds per phase")
+    return parser
+
+
+def sweep(label, variants, passthrough, phases):
+    """Run ``bench.run`` once per variant, each in a fresh process, and print them side by side.
+
+    ``variants`` maps each variant to the arguments and environment of its
+    run, every run also gets ``passthrough``. Only ``phases`` are printed.
+    """
+    results = {}
+    workdir = Path(tempfile.mkdtemp(prefix=f"acetate-{label}-"))
+    for variant, (args, env) in variants.items():
+        emit(f"running {label} {variant} ...")
+        saved = workdir / f"{variant}.json"
+        subprocess.run(  # noqa: S603
+            [sys.executable, "-m", "bench.run", *args, *passthrough, "--save", str(saved)],
+            env={**os.environ, **env},
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        with saved.open() as f:
+            results[variant] = json.load(f)["phases"]
+
+    emit(
+        f"{label:>8}  {'phase':<12}{'reqs':>7}{'errs':>6}{'rps':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rss MiB':>9}",
+    )
+    for variant, run in results.items():
+        for name in phases:
+            r = run.get(name)
+            if not r:
+                continue
+            if not r["requests"]:
+                emit(f"{variant:>8}  {name:<12}{0:>7}{r['errors']:>6}")
+                continue
+            emit(
+                f"{variant:>8}  {name:<12}{r['requests']:>7}{r['errors']:>6}{r['rps']:>9.1f}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                f"{r['peak_rss_mib']:>9.0f}",
+            )
+
+
+def main():  # noqa: PLR0915
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="fixture file, synthetic data when left out")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per phase")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--routes", help="comma separated routes, all by default")
+    parser.add_argument("--no-isolated", action="store_true", help="only run the mix")
+    parser.add_argument("--anonymous", action="store_true", help="don't log the clients in")
+    parser.add_argument("--wanted", type=int, default=1000, help="size of the user's wantlist")
+    parser.add_argument("--hidden", type=int, default=10000, help="size of the user's hidden set")
+    parser.add_argument("--es-latency", type=float, default=5, help="ms")
+    parser.add_argument("--axum-latency", type=float, default=20, help="ms")
+    parser.add_argument("--discogs-latency", type=float, default=150, help="ms")
+    parser.add_argument(
+        "--count-latency",
+        type=float,
+        default=0,
+        help="ms axum adds to count a listing's matches",
+    )
+    parser.add_argument(
+        "--full-source",
+        action="store_true",
+        help="stand-ins ignore the fields asked for and send whole documents",
+    )
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--import-profile", type=int, default=10, metavar="N")
+    args = parser.parse_args()
+
+    data = bench_fixtures.load(args.fixtures) if args.fixtures else bench_fixtures.generate()
+    stubs = Stubs(
+        data,
+        {
+            "es": args.es_latency / 1000,
+            "axum": args.axum_latency / 1000,
+            "discogs": args.discogs_latency / 1000,
+        },
+        count_latency=args.count_latency / 1000,
+        full_source=args.full_source,
+    )
+    workdir = Path(tempfile.mkdtemp(prefix="acetate-bench-"))
+    configure(stubs, workdir)
+    startup_seconds, imports = startup(os.environ.copy(), args.import_profile)
+    for seconds, module in imports:
+        emit(f"import {module:<40}{seconds:>8.3f}s")
+
+    import app as app_module  # noqa: PLC0415
+
+    seed(app_module, data, args.wanted, args.hidden)
+    app_module.app.config["DEBUG"] = False
+
+    mix = scenarios(data)
+    if args.anonymous:
+        mix = {k: v for k, v in mix.items() if k not in ("thumbs", "prices")}
+    if args.routes:
+        mix = {k: v for k, v in mix.items() if k in args.routes.split(",")}
+
+    run = {"concurrency": args.concurrency, "logged_in": not args.anonymous}
+    drive(app_module.app, mix, duration=args.warmup, seed=0, **run)
+
+    rss = RssSampler()
+    phases = {}
+    plan = [] if args.no_isolated else [(name, {name: mix[name]}) for name in mix]
+    plan.append(("mix", mix))
+    for seed_, (name, phase_mix) in enumerate(plan, 1):
+        emit(f"running {name} ...")
+        rss.reset()
+        upstream = stubs.traffic.total()
+        started = time.perf_counter()
+        results = drive(app_module.app, phase_mix, duration=args.duration, seed=seed_, **run)
+        elapsed = time.perf_counter() - started
+        if name == "mix":
+            for route, r in results.items():
+                phases[f"mix:{route}"] = summarize(
+                    r["latencies"],
+                    r["errors"],
+                    elapsed,
+                    rss.peak,
+                    sent=r["bytes"],
+                )
+        phases[name] = summarize(
+            [x for r in results.values() for x in r["latencies"]],
+            sum(r["errors"] for r in results.values()),
+            elapsed,
+            rss.peak,
+            sent=sum(r["bytes"] for r in results.values()),
+            # background work (prefetches, facet refreshes) is billed to the phase it ran in
+            upstream=stubs.traffic.total() - upstream,
+        )
+    rss.stop()
+    stubs.stop()
+
+    results = {
+        "startup_seconds": startup_seconds,
+        # ES holds a search context for each until it expires or is closed
+        "open_pits": stubs.pits.live(),
+        "args": vars(args),
+        "phases": phases,
+    }
+    report(results)
+
+    if args.save:
+        with Path(args.save).open("w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with Path(args.baseline).open() as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+        emit(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
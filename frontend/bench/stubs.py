@@ -0,0 +1,403 @@
+"""Local stand-ins for Elasticsearch, the axum API and the Discogs API.
+
+They answer from the fixtures with responses shaped like the real ones, after
+a configurable delay standing in for the network and the service itself.
+Queries are not evaluated: a search returns a slice of the index picked by
+hashing the query, so different queries still get different pages.
+"""
+
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
+from urllib.parse import parse_qs, urlsplit
+
+from pyroaring import BitMap
+
+
+def project(doc, includes):
+    """Keep the dotted ``includes`` paths of ``doc``, like ES' _source filtering."""
+    if not includes:
+        return doc
+    out = {}
+    for path in includes:
+        _copy(doc, out, path.split("."))
+    return out
+
+
+def _copy(src, dst, keys):
+    key, rest = keys[0], keys[1:]
+    if key not in src:
+        return
+    value = src[key]
+    if not rest:
+        dst[key] = value
+    elif isinstance(value, list):
+        items = dst.setdefault(key, [{} for _ in value])
+        for item, target in zip(value, items, strict=True):
+            if isinstance(item, dict):
+                _copy(item, target, rest)
+    elif isinstance(value, dict):
+        _copy(value, dst.setdefault(key, {}), rest)
+
+
+def _slice(docs, query, offset, size):
+    start = int(hashlib.blake2b(query.encode(), digest_size=4).hexdigest(), 16) % max(len(docs), 1)
+    rotated = docs[start:] + docs[:start]
+    return rotated[offset : offset + size]
+
+
+def _hit(index, doc, includes, position):
+    return {
+        "_index": index,
+        "_id": doc["id"],
+        "_score": 1.0,
+        "_source": project({k: v for k, v in doc.items() if k != "id"}, includes),
+        "sort": [doc.get("released", ""), position],
+    }
+
+
+class PitRegistry:
+    """The points in time open on the ES stand-in, each kept alive by searching it."""
+
+    keep_alive = 600
+
+    def __init__(self):
+        self.deadlines = {}
+        self._lock = threading.Lock()
+
+    def add(self, pit):
+        with self._lock:
+            self.deadlines[pit] = time.monotonic() + self.keep_alive
+
+    def use(self, pit):
+        """Extend ``pit``'s keep-alive, returns False if it is gone."""
+        now = time.monotonic()
+        with self._lock:
+            if self.deadlines.get(pit, 0) < now:
+                self.deadlines.pop(pit, None)
+                return False
+            self.deadlines[pit] = now + self.keep_alive
+            return True
+
+    def close(self, pit):
+        with self._lock:
+            return self.deadlines.pop(pit, None) is not None
+
+    def expire(self):
+        with self._lock:
+            self.deadlines.clear()
+
+    def live(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(deadline >= now for deadline in self.deadlines.values())
+
+
+def pit_missing(pit):
+    """The error ES answers a search in an expired or closed point in time with."""
+    cause = {
+        "type": "search_context_missing_exception",
+        "reason": f"No search context found for id [{pit}]",
+    }
+    return {
+        "error": {
+            "root_cause": [cause],
+            "type": "search_phase_execution_exception",
+            "reason": "all shards failed",
+        },
+        "status": 404,
+    }
+
+
+class Traffic:
+    """Bytes of response bodies each stand-in has sent."""
+
+    def __init__(self):
+        self.sent = {}
+        self._lock = threading.Lock()
+
+    def add(self, service, size):
+        with self._lock:
+            self.sent[service] = self.sent.get(service, 0) + size
+
+    def total(self):
+        with self._lock:
+            return sum(self.sent.values())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    fixtures = None
+    service = None
+    traffic = None
+    # answer with whole documents whatever fields were asked for, as before searches projected
+    full_source = False
+    headers_out: ClassVar[dict] = {}
+    routes: ClassVar[list] = []
+
+    def log_message(self, *args):
+        pass
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+        self.query = parse_qs(url.query)
+        time.sleep(self.latency)
+        for method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if match and method == self.command:
+                status, payload = handler(self, *match.groups())
+                break
+        else:
+            status, payload = 404, {"error": f"no stand-in for {self.command} {url.path}"}
+
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in self.headers_out.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.traffic.add(self.service, len(data))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch  # noqa: N815
+
+    def json_body(self):
+        return json.loads(self.body) if self.body else {}
+
+    def arg(self, name, default=None):
+        return self.query.get(name, [default])[0]
+
+    def hit(self, index, doc, includes, position):
+        return _hit(index, doc, None if self.full_source else includes, position)
+
+
+class Elasticsearch(_Handler):
+    headers_out: ClassVar[dict] = {"X-Elastic-Product": "Elasticsearch"}
+
+    def search(self, index):
+        body = self.json_body()
+        docs = self.fixtures[index]
+        size = int(body.get("size", self.arg("size", 10)))
+        offset = int(body.get("from", self.arg("from", 0)))
+        source = body.get("_source")
+        includes = source.get("includes") if isinstance(source, dict) else source
+        query = json.dumps(body.get("query"), sort_keys=True)
+
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(docs), "relation": "eq"},
+                "hits": [
+                    self.hit(index, doc, includes, offset + i)
+                    for i, doc in enumerate(_slice(docs, query, offset, size))
+                ],
+            },
+        }
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        if "labels" in body.get("aggs", {}):
+            response["aggregations"] = {"labels": {"name": {"buckets": self.label_buckets(query)}}}
+        return 200, response
+
+    def label_buckets(self, query):
+        counts = {}
+        for release in _slice(self.fixtures["releases"], query, 0, 500):
+            for label in release.get("labels", []):
+                counts.setdefault(label["name"], [label["id"], 0])[1] += 1
+        return [
+            {"key": name, "doc_count": n, "id": {"hits": {"hits": [{"_source": {"id": id_}}]}}}
+            for name, (id_, n) in sorted(counts.items(), key=lambda kv: -kv[1][1])[:50]
+        ]
+
+    def get(self, index, doc_id):
+        doc = self.fixtures["by_id"][index].get(doc_id)
+        if doc is None:
+            return 404, {"_index": index, "_id": doc_id, "found": False}
+        includes = self.arg("_source_includes")
+        hit = self.hit(index, doc, includes.split(",") if includes else None, 0)
+        return 200, {**hit, "found": True}
+
+    def open_point_in_time(self, index):
+        pit = f"pit-{index}-{time.monotonic_ns()}"
+        self.pits.add(pit)
+        return 200, {"id": pit}
+
+    def close_point_in_time(self):
+        pit = self.json_body().get("id")
+        if not self.pits.close(pit):
+            return 404, {"succeeded": True, "num_freed": 0}
+        return 200, {"succeeded": True, "num_freed": 1}
+
+    routes: ClassVar[list] = [
+        ("POST", r"/(\w+)/_search", search),
+        ("GET", r"/(\w+)/_search", search),
+        ("GET", r"/(\w+)/_doc/(\w+)", get),
+        ("POST", r"/(\w+)/_pit", open_point_in_time),
+        ("DELETE", r"/_pit", close_point_in_time),
+    ]
+
+
+class Axum(_Handler):
+    # stands in for counting every match of the filters, skipped with track_total_hits=false
+    count_latency = 0.0
+
+    def releases(self):
+        pit = self.arg("pit")
+        if pit and not self.pits.use(pit):
+            return 404, pit_missing(pit)
+        hidden = BitMap.deserialize(self.body) if self.body else BitMap()
+        docs = [r for r in self.fixtures["releases"] if int(r["id"]) not in hidden]
+        for field, value in zip(
+            self.query.get("field", []),
+            self.query.get("value", []),
+            strict=False,
+        ):
+            if field in ("styles", "country"):
+                docs = [r for r in docs if value in r.get(field, [])]
+        offset = int(self.arg("from", 0))
+        size = int(self.arg("size", 10))
+        query = json.dumps(self.query, sort_keys=True)
+        includes = self.query.get("source")
+
+        response = {
+            "hits": {
+                "hits": [
+                    self.hit("releases", doc, includes, offset + i)
+                    for i, doc in enumerate(_slice(docs, query, offset, size))
+                ],
+            },
+        }
+        if self.arg("track_total_hits") != "false":
+            time.sleep(self.count_latency)
+            # like ES, which stops counting at 10,000
+            response["hits"]["total"] = (
+                {"value": len(docs), "relation": "eq"}
+                if len(docs) <= 10000  # noqa: PLR2004
+                else {"value": 10000, "relation": "gte"}
+            )
+        if self.arg("pit"):
+            response["pit_id"] = self.arg("pit")
+        return 200, response
+
+    def filters(self):
+        return 200, {"aggregations": self.fixtures["filters"]}
+
+    def release(self):
+        doc = self.fixtures["by_id"]["releases"].get(self.arg("id"))
+        if doc is None:
+            return 404, {"found": False}
+        return 200, {**self.hit("releases", doc, self.query.get("source"), 0), "found": True}
+
+    routes: ClassVar[list] = [
+        ("POST", r"/releases", releases),
+        ("GET", r"/filters", filters),
+        ("GET", r"/release", release),
+    ]
+
+
+class Discogs(_Handler):
+    headers_out: ClassVar[dict] = {
+        "X-Discogs-Ratelimit": "60",
+        "X-Discogs-Ratelimit-Remaining": "59",
+    }
+
+    def release(self, release_id):
+        doc = self.fixtures["by_id"]["releases"].get(release_id, {"id": release_id})
+        thumb = f"https://i.discogs.com/{release_id}-150.jpg"
+        return 200, {**doc, "thumb": thumb, "images": [{"uri150": thumb, "type": "primary"}]}
+
+    def price_suggestions(self, release_id):
+        base = int(release_id) % 40 + 5
+        return 200, {
+            f"{name} ({short})": {"currency": "USD", "value": base * factor}
+            for name, short, factor in [
+                ("Mint", "M", 2.0),
+                ("Near Mint", "NM or M-", 1.6),
+                ("Very Good Plus", "VG+", 1.2),
+                ("Very Good", "VG", 0.8),
+            ]
+        }
+
+    def wants(self, _username):
+        ids = [r["id"] for r in self.fixtures["releases"][:500]]
+        page = int(self.arg("page", 1))
+        per_page = int(self.arg("per_page", 50))
+        return 200, {
+            "pagination": {"page": page, "pages": -(-len(ids) // per_page), "items": len(ids)},
+            "wants": [{"id": int(i)} for i in ids[(page - 1) * per_page : page * per_page]],
+        }
+
+    def want(self, _username, _release_id):
+        return 201, {}
+
+    def identity(self):
+        return 200, {"id": 1, "username": "bench"}
+
+    routes: ClassVar[list] = [
+        ("GET", r"/releases/(\d+)", release),
+        ("GET", r"/marketplace/price_suggestions/(\d+)", price_suggestions),
+        ("GET", r"/users/([^/]+)/wants", wants),
+        ("PUT", r"/users/([^/]+)/wants/(\d+)", want),
+        ("DELETE", r"/users/([^/]+)/wants/(\d+)", want),
+        ("GET", r"/oauth/identity", identity),
+    ]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the app hanging up, e.g. on a superseded search, is expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Stubs:
+    """Runs one server per service on free local ports."""
+
+    def __init__(self, fixtures, latency, count_latency=0.0, *, full_source=False):
+        fixtures = {
+            **fixtures,
+            "by_id": {
+                "releases": {r["id"]: r for r in fixtures["releases"]},
+                "artists": {a["id"]: a for a in fixtures["artists"]},
+            },
+        }
+        self.servers = {}
+        self.pits = PitRegistry()
+        self.traffic = Traffic()
+        for name, handler in (("es", Elasticsearch), ("axum", Axum), ("discogs", Discogs)):
+            handler_class = type(
+                handler.__name__,
+                (handler,),
+                {
+                    "fixtures": fixtures,
+                    "latency": latency.get(name, 0.0),
+                    "count_latency": count_latency,
+                    "pits": self.pits,
+                    "service": name,
+                    "traffic": self.traffic,
+                    "full_source": full_source,
+                },
+            )
+            server = _Server(("127.0.0.1", 0), handler_class)
+            threading.Thread(target=server.serve_forever, name=f"stub-{name}", daemon=True).start()
+            self.servers[name] = server
+
+    def url(self, name):
+        host, port = self.servers[name].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
@@ -0,0 +1,129 @@
+"""In-process caches shared by the requests a worker serves."""
+
+import threading
+from collections import OrderedDict
+
+
+class BitmapCache:
+    """LRU of deserialized bitmaps per user, bounded by their serialized size.
+
+    Entries carry the version they were loaded at; a lookup with any other
+    version is a miss, so bumping the version in the database is enough to
+    stop every worker serving the old bitmap.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key):
+        """The version cached for ``key``, or None; not counted as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, version, bitmap, nbytes):
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (version, bitmap, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class Prefetcher:
+    """Holds one speculatively fetched page per session, as a future.
+
+    ``take`` hands the entry over only if its key matches the page being
+    asked for. Entries replaced, evicted or invalidated before being taken
+    are cancelled and counted as wasted.
+    """
+
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, session, key, future):
+        with self._lock:
+            self._discard(session)
+            self._entries[session] = (key, future)
+            self.started += 1
+            while len(self._entries) > self.max_sessions:
+                self._discard(next(iter(self._entries)))
+
+    def take(self, session, key):
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is None or entry[0] != key:
+                self.misses += 1
+                return None
+            del self._entries[session]
+            self.hits += 1
+            return entry[1]
+
+    def invalidate(self, session):
+        with self._lock:
+            self._discard(session)
+
+    def _discard(self, session):
+        entry = self._entries.pop(session, None)
+        if entry is not None:
+            entry[1].cancel()
+            self.wasted += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_sessions": self.max_sessions,
+                "started": self.started,
+                "hits": self.hits,
+                "misses": self.misses,
+                "wasted": self.wasted,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "waste_rate": self.wasted / self.started if self.started else 0.0,
+            }
@@ -0,0 +1,237 @@
+"""Shared clients for the services behind the views.
+
+Clients are created on first use so they pick up the environment loaded by
+``load_dotenv`` and so a forked worker never inherits a parent's sockets.
+"""
+
+import atexit
+import os
+
+import httpx
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+from sqlalchemy import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import aio
+from timings import timed
+
+_es = None
+_async_es = None
+_axum = None
+_axum_sync = None
+_posthog = None
+_async_db = None
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _reset_after_fork():
+    global _es, _async_es, _axum, _axum_sync, _posthog, _async_db  # noqa: PLW0603
+
+    _es = None
+    _async_es = None
+    _axum = None
+    _axum_sync = None
+    _posthog = None
+    _async_db = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def es_mode() -> str:
+    # "async" shares one bounded pool per worker on the worker loop, "sync" keeps
+    # the blocking client for deployments that cannot run the loop thread
+    return os.environ.get("ES_CLIENT_MODE", "async")
+
+
+def _es_options():
+    options = {
+        "basic_auth": ("elastic", os.environ.get("ES_PASSWORD", "")),
+        "connections_per_node": int(os.environ.get("ES_MAX_CONNECTIONS", "10")),
+    }
+    # ES_URL points at a plain node (e.g. a local one) instead of the cloud deployment
+    if "ES_URL" in os.environ:
+        options["hosts"] = [os.environ["ES_URL"]]
+    else:
+        options["cloud_id"] = os.environ.get("ES_CLOUD_ID", "http://localhost:9200")
+    return options
+
+
+def es() -> Elasticsearch:
+    global _es  # noqa: PLW0603
+
+    if _es is None:
+        _es = Elasticsearch(**_es_options())
+    return _es
+
+
+def async_es() -> AsyncElasticsearch:
+    global _async_es  # noqa: PLW0603
+
+    if _async_es is None:
+        _async_es = AsyncElasticsearch(**_es_options())
+    return _async_es
+
+
+@aio.on_shutdown
+async def _close_async_es():
+    if _async_es is not None:
+        await _async_es.close()
+
+
+async def es_search(*, supersede=None, **kwargs):
+    """Search, cancelling any earlier search still running under ``supersede``.
+
+    Cancellation needs the async client, in sync mode the search just runs.
+    """
+    with timed("es"):
+        if es_mode() == "sync":
+            return es().search(**kwargs)
+        if supersede is not None:
+            return await aio.run_latest(supersede, async_es().search(**kwargs))
+        return await aio.run(async_es().search(**kwargs))
+
+
+async def es_get(**kwargs):
+    with timed("es"):
+        if es_mode() == "sync":
+            return es().get(**kwargs)
+        return await aio.run(async_es().get(**kwargs))
+
+
+async def es_open_point_in_time(**kwargs):
+    with timed("es"):
+        if es_mode() == "sync":
+            return es().open_point_in_time(**kwargs)
+        return await aio.run(async_es().open_point_in_time(**kwargs))
+
+
+async def es_close_point_in_time(**kwargs):
+    if es_mode() == "sync":
+        return es().close_point_in_time(**kwargs)
+    return await aio.run(async_es().close_point_in_time(**kwargs))
+
+
+def _axum_options():
+    return {
+        "base_url": os.environ.get("AXUM_API", "https://acetate.onrender.com/"),
+        "http2": True,
+        "limits": httpx.Limits(
+            max_connections=int(os.environ.get("AXUM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.environ.get("AXUM_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.environ.get("AXUM_KEEPALIVE_EXPIRY", "60")),
+        ),
+    }
+
+
+def axum() -> httpx.AsyncClient:
+    """Keep-alive client for the axum API, only usable through ``aio.run``."""
+    global _axum  # noqa: PLW0603
+
+    if _axum is None:
+        _axum = httpx.AsyncClient(**_axum_options())
+    return _axum
+
+
+def axum_sync() -> httpx.Client:
+    global _axum_sync  # noqa: PLW0603
+
+    if _axum_sync is None:
+        _axum_sync = httpx.Client(**_axum_options())
+    return _axum_sync
+
+
+@aio.on_shutdown
+async def _close_axum():
+    if _axum is not None:
+        await _axum.aclose()
+
+
+@atexit.register
+def _close_axum_sync():
+    if _axum_sync is not None:
+        _axum_sync.close()
+
+
+def async_db() -> async_sessionmaker:
+    """Sessions on the async engine, only usable through ``aio.run``."""
+    global _async_db  # noqa: PLW0603
+
+    if _async_db is None:
+        url = make_url(os.environ["DATABASE_URL"])
+        engine = create_async_engine(
+            url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]),
+            pool_size=int(os.environ.get("DB_ASYNC_POOL_SIZE", "10")),
+            max_overflow=int(os.environ.get("DB_ASYNC_MAX_OVERFLOW", "10")),
+            # a ping is a round trip per checkout, recycling idle connections is enough
+            pool_pre_ping=os.environ.get("DB_POOL_PRE_PING", "off") == "on",
+            pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", "300")),
+            # reuse the warmest connections, the spare ones sit idle until recycled
+            pool_use_lifo=True,
+            # only reads go through here, without BEGIN and ROLLBACK around each one;
+            # asyncpg prepares each statement once per connection and reuses it
+            isolation_level="AUTOCOMMIT",
+        )
+        _async_db = async_sessionmaker(engine, expire_on_commit=False)
+    return _async_db
+
+
+async def db_execute(statement, params=None):
+    """Run a read on the async engine and return all its rows."""
+
+    async def execute():
+        async with async_db()() as session:
+            return (await session.execute(statement, params)).all()
+
+    return await aio.run(execute())
+
+
+@aio.on_shutdown
+async def _close_async_db():
+    if _async_db is not None:
+        await _async_db.kw["bind"].dispose()
+
+
+def _pool_usage(client):
+    if client is None:
+        return {"connections": 0, "idle": 0, "waiting": 0}
+
+    # httpx does not expose its pool, reach into httpcore's
+    pool = client._transport._pool  # noqa: SLF001
+    return {
+        "connections": len(pool.connections),
+        "idle": sum(c.is_idle() for c in pool.connections),
+        "waiting": sum(r.is_queued() for r in pool._requests),  # noqa: SLF001
+    }
+
+
+def _db_pool_usage():
+    if _async_db is None:
+        return {"connections": 0, "idle": 0}
+
+    pool = _async_db.kw["bind"].pool
+    return {"connections": pool.checkedin() + pool.checkedout(), "idle": pool.checkedin()}
+
+
+def pool_stats():
+    return {
+        "axum": _pool_usage(_axum),
+        "axum_sync": _pool_usage(_axum_sync),
+        "db_async": _db_pool_usage(),
+    }
+
+
+def posthog():
+    global _posthog  # noqa: PLW0603
+
+    if _posthog is None:
+        # imported here so workers only pay for it once something is reported
+        from posthog import Posthog  # noqa: PLC0415
+
+        _posthog = Posthog(
+            project_api_key=os.environ.get("POSTHOG_API_KEY"),
+            host="https://us.i.posthog.com",
+            enable_exception_autocapture=True,
+        )
+    return _posthog
@@ -0,0 +1,165 @@
+"""Persistent cache of Discogs API responses.
+
+Responses are kept as JSON in a SQLite file shared by every worker on the
+host, so they survive restarts. Each kind of response has a fresh and a stale
+TTL: fresh entries are served as is, stale ones are served while a background
+refresh runs, and anything older is fetched before returning. Concurrent
+fetches of the same entry share one upstream call.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class DiscogsCache:
+    def __init__(self, path, ttls):
+        """``ttls`` maps a kind to its ``(fresh, stale)`` TTLs in seconds."""
+        self.path = path
+        self.ttls = ttls
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refresher = ThreadPoolExecutor(4, thread_name_prefix="discogs-cache")
+        self._fanout = ThreadPoolExecutor(8, thread_name_prefix="discogs-fetch")
+        self.fetches = 0
+        self.failures = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refresher = ThreadPoolExecutor(4, thread_name_prefix="discogs-cache")
+        self._fanout = ThreadPoolExecutor(8, thread_name_prefix="discogs-fetch")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " kind TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (kind, key))",
+            )
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, kind, keys):
+        """Return ``{key: (value, age)}`` for the cached keys, expired or not."""
+        keys = [str(k) for k in keys]
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._connection().execute(
+            f"SELECT key, value, fetched_at FROM responses WHERE kind = ? AND key IN ({', '.join('?' * len(keys))})",  # noqa: E501, S608
+            [kind, *keys],
+        )
+        return {key: (json.loads(value), now - fetched_at) for key, value, fetched_at in rows}
+
+    def put(self, kind, key, value):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (kind, key, value, fetched_at) VALUES (?, ?, ?, ?)",
+            (kind, str(key), json.dumps(value), time.time()),
+        )
+
+    def get_or_fetch(self, kind, key, fetch):
+        """Return the cached value for ``key``, calling ``fetch()`` when needed.
+
+        ``fetch`` may run on a background thread to revalidate a stale entry.
+        """
+        fresh, stale = self.ttls[kind]
+        cached = self.get_many(kind, [key]).get(str(key))
+        if cached is not None:
+            value, age = cached
+            if age < fresh:
+                return value
+            if age < stale:
+                self._refresher.submit(self._fetch, kind, key, fetch, background=True)
+                return value
+        return self._fetch(kind, key, fetch).result()
+
+    def get_or_fetch_many(self, kind, keys, fetch):
+        """Bulk ``get_or_fetch``, misses are fetched concurrently with ``fetch(key)``.
+
+        Keys whose fetch fails are left out of the result.
+        """
+        fresh, stale = self.ttls[kind]
+        cached = self.get_many(kind, keys)
+        results = {}
+        misses = {}
+        for key in map(str, keys):
+            value, age = cached.get(key, (None, stale))
+            if age < stale:
+                results[key] = value
+                if age >= fresh:
+                    self._refresher.submit(
+                        self._fetch,
+                        kind,
+                        key,
+                        partial(fetch, key),
+                        background=True,
+                    )
+            elif key not in misses:
+                misses[key] = self._fanout.submit(self._fetch, kind, key, partial(fetch, key))
+
+        for key, future in misses.items():
+            try:
+                results[key] = future.result().result()
+            except Exception:
+                logger.warning("fetching %s %s from Discogs failed", kind, key, exc_info=True)
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "fetches": self.fetches,
+                "failures": self.failures,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+            }
+
+    def _fetch(self, kind, key, fetch, *, background=False):
+        """Fetch ``key`` unless a fetch of it is running already, returns its future.
+
+        A ``background`` refresh has nobody waiting on it, its failure is only logged.
+        """
+        with self._lock:
+            future = self._inflight.get((kind, str(key)))
+            if future is not None:
+                return future
+            future = self._inflight[(kind, str(key))] = Future()
+            self.fetches += 1
+            self.refreshes += background
+
+        try:
+            value = fetch()
+            self.put(kind, key, value)
+            future.set_result(value)
+        except Exception as e:
+            if background:
+                logger.warning("refreshing %s %s from Discogs failed", kind, key, exc_info=True)
+            with self._lock:
+                self.failures += 1
+                self.refresh_failures += background
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[(kind, str(key))]
+        return future
@@ -1,2 +1,10 @@
 class LoggedOutError(Exception):
     pass
+
+
+class PitExpiredError(Exception):
+    """Raised when a search's point in time has expired or was closed."""
+
+
+class DiscogsRejectedError(Exception):
+    """Raised when Discogs refuses a call for a reason asking again won't fix."""
@@ -0,0 +1,136 @@
+"""A JSON value shared by every worker on the host through a file.
+
+Each worker keeps the copy it last read and re-reads the file when its
+mtime changes. Once the file is older than ``fresh`` the old value is still
+served while one worker, holding an flock on ``<path>.lock``, fetches a new
+one in the background. The file outlives restarts, so a fresh worker only
+has to wait for ``fetch`` if no worker on the host ever wrote it.
+
+Subclasses store other values by overriding ``_read`` and ``_write``.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SharedValue:
+    def __init__(self, path, fetch, fresh):
+        self.path = Path(path)
+        self.fetch = fetch
+        self.fresh = fresh
+        self.refreshes = 0
+        self._value = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._started = False
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # a refresh running at the fork is not forked with it, but its lock file
+        # is, and while the child keeps that open the flock is never released
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        """Fetch in the background now if there is nothing to warm up from.
+
+        Only the first call in each process does anything. Call it in the
+        workers, not in a master that forks them.
+        """
+        if self._started:
+            return
+        self._started = True
+        if self._stat() is None:
+            threading.Thread(target=self._refresh, args=(False,), daemon=True).start()
+
+    def get(self):
+        mtime = self._stat()
+        if mtime is not None and mtime != self._mtime:
+            self._load(mtime)
+        if self._value is None:
+            self._refresh(block=True)
+        elif time.time() - self._mtime >= self.fresh and not self._lock.locked():
+            threading.Thread(target=self._refresh, args=(False,), daemon=True).start()
+        return self._value
+
+    def stats(self):
+        return {
+            "loaded": self._value is not None,
+            "age": time.time() - self._mtime if self._mtime is not None else None,
+            "fresh": self.fresh,
+            "refreshes": self.refreshes,
+        }
+
+    def _stat(self):
+        try:
+            return self.path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load(self, mtime):
+        with self.path.open("rb") as f:
+            self._value = self._read(f)
+        self._mtime = mtime
+
+    def _read(self, f):
+        return json.load(f)
+
+    def _write(self, value, f):
+        f.write(json.dumps(value).encode())
+
+    def _refresh(self, block):
+        # one refresh per worker, and through the flock one per host
+        if not self._lock.acquire(blocking=block):
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # opened O_CLOEXEC like every file Python opens
+            self._lock_file = self.path.with_suffix(".lock").open("w")
+            try:
+                fcntl.flock(
+                    self._lock_file,
+                    fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB,
+                )
+            except BlockingIOError:
+                return
+            try:
+                self._fetch_unless_fresh()
+            finally:
+                # closing would leave it locked while a forked child holds a copy
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        except Exception:
+            if block:
+                raise
+            logger.exception("refreshing %s failed", self.path)
+        finally:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+            self._lock.release()
+
+    def _fetch_unless_fresh(self):
+        # another worker may have written it while we waited for the lock
+        mtime = self._stat()
+        if mtime is not None and time.time() - mtime < self.fresh:
+            self._load(mtime)
+            return
+
+        value = self.fetch()
+        partial = self.path.with_suffix(".tmp")
+        with partial.open("wb") as f:
+            self._write(value, f)
+        partial.replace(self.path)
+        self._value = value
+        self._mtime = self._stat()
+        self.refreshes += 1
@@ -0,0 +1,21 @@
+"""Gunicorn settings, read from the working directory when gunicorn starts."""
+
+import gc
+import os
+
+# import the app once in the master so workers share its pages copy-on-write;
+# everything holding threads, sockets or locks is recreated after the fork, and the
+# facets and name index are only fetched once a worker serves its first request
+preload_app = os.environ.get("GUNICORN_PRELOAD", "on") == "on"
+
+
+def pre_fork(server, worker):  # noqa: ARG001
+    # objects the collector never visits keep their pages shared with the master
+    gc.freeze()
+
+
+# with ASYNC_VIEWS=loop a worker's async views all run on its event loop and the
+# request threads only wait on them, so each worker can hold many more requests
+if os.environ.get("ASYNC_VIEWS") == "loop":
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", "200"))
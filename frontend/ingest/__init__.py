@@ -0,0 +1 @@
+"""Loads the monthly Discogs XML dumps into the Elasticsearch indices the app reads."""
@@ -0,0 +1,212 @@
+"""The documents and mappings of the ``releases`` and ``artists`` indices.
+
+Records from the dump become documents in the shape the views and the axum
+API query: lists instead of the dump's wrapper elements (``artists`` rather
+than ``artists.artist``), attributes as plain keys, and ``#text`` where an
+element has both, as in ``master_id`` or an artist's ``aliases``. Videos are
+reduced to their YouTube ids. Images and companies are left out, nothing
+reads them from the index.
+"""
+
+import re
+
+YOUTUBE_ID = re.compile(r"[?&]v=([\w-]{11})|youtu\.be/([\w-]{11})")
+
+
+def _text(element, path):
+    child = element.find(path)
+    if child is None or child.text is None:
+        return None
+    return child.text.strip() or None
+
+
+def _texts(element, path):
+    return [child.text.strip() for child in element.iterfind(path) if child.text]
+
+
+def _prune(doc):
+    return {key: value for key, value in doc.items() if value not in (None, "", [], {})}
+
+
+def _credit(artist):
+    return _prune(
+        {
+            "id": _text(artist, "id"),
+            "name": _text(artist, "name"),
+            "anv": _text(artist, "anv"),
+            "join": _text(artist, "join"),
+            "role": _text(artist, "role"),
+            "tracks": _text(artist, "tracks"),
+        },
+    )
+
+
+def _credits(element, path):
+    return [_credit(artist) for artist in element.iterfind(path)]
+
+
+def _track(track):
+    return _prune(
+        {
+            "position": _text(track, "position"),
+            "title": _text(track, "title"),
+            "duration": _text(track, "duration"),
+            "artists": _credits(track, "artists/artist"),
+            "extraartists": _credits(track, "extraartists/artist"),
+        },
+    )
+
+
+def _video(video):
+    match = YOUTUBE_ID.search(video.get("src", ""))
+    return match and (match[1] or match[2])
+
+
+def release(element):
+    master = element.find("master_id")
+    doc = {
+        "title": _text(element, "title"),
+        "released": _text(element, "released"),
+        "country": _text(element, "country"),
+        "notes": _text(element, "notes"),
+        "data_quality": _text(element, "data_quality"),
+        "genres": _texts(element, "genres/genre"),
+        "styles": _texts(element, "styles/style"),
+        "artists": _credits(element, "artists/artist"),
+        "extraartists": _credits(element, "extraartists/artist"),
+        "labels": [_prune(dict(label.attrib)) for label in element.iterfind("labels/label")],
+        "formats": [
+            _prune({**f.attrib, "descriptions": _texts(f, "descriptions/description")})
+            for f in element.iterfind("formats/format")
+        ],
+        "identifiers": [_prune(dict(i.attrib)) for i in element.iterfind("identifiers/identifier")],
+        "tracklist": [_track(track) for track in element.iterfind("tracklist/track")],
+        "videos": [v for v in map(_video, element.iterfind("videos/video")) if v],
+    }
+    if master is not None and master.text:
+        doc["master_id"] = {
+            "#text": master.text.strip(),
+            "is_main_release": master.get("is_main_release", "false"),
+        }
+    return element.get("id"), _prune(doc)
+
+
+def _names(element, path):
+    return [
+        _prune({"id": name.get("id"), "#text": name.text and name.text.strip()})
+        for name in element.iterfind(path)
+    ]
+
+
+def artist(element):
+    doc = {
+        "name": _text(element, "name"),
+        "realname": _text(element, "realname"),
+        "profile": _text(element, "profile"),
+        "data_quality": _text(element, "data_quality"),
+        "urls": _texts(element, "urls/url"),
+        "namevariations": _texts(element, "namevariations/name"),
+        "aliases": _names(element, "aliases/name"),
+        "groups": _names(element, "groups/name"),
+        "members": _prune({"name": _names(element, "members/name")}),
+    }
+    return _text(element, "id"), _prune(doc)
+
+
+_KEYWORD = {"type": "keyword"}
+_TEXT = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+_FOLDED = {
+    "type": "text",
+    "fields": {
+        "folded": {"type": "text", "analyzer": "folded"},
+        "keyword": {"type": "keyword", "ignore_above": 256},
+    },
+}
+_CREDIT = {
+    "type": "nested",
+    "properties": {
+        "id": _KEYWORD,
+        "name": _TEXT,
+        "anv": _TEXT,
+        "join": _KEYWORD,
+        "role": {"type": "text"},
+        "tracks": {"type": "text"},
+    },
+}
+_NAME = {"properties": {"id": _KEYWORD, "#text": _TEXT}}
+
+SETTINGS = {
+    "analysis": {
+        "analyzer": {
+            "folded": {"tokenizer": "standard", "filter": ["lowercase", "asciifolding"]},
+        },
+    },
+}
+
+MAPPINGS = {
+    "releases": {
+        "dynamic": False,
+        "properties": {
+            "title": _TEXT,
+            # sorted on, and matched whole through the subfield by the quick filter
+            "released": {"type": "keyword", "fields": {"keyword": _KEYWORD}},
+            "country": _KEYWORD,
+            "notes": {"type": "text"},
+            "data_quality": _KEYWORD,
+            "genres": _KEYWORD,
+            "styles": _KEYWORD,
+            "videos": _KEYWORD,
+            "artists": _CREDIT,
+            "extraartists": _CREDIT,
+            "labels": {
+                "type": "nested",
+                "properties": {"id": _KEYWORD, "name": _TEXT, "catno": _TEXT},
+            },
+            "formats": {
+                "properties": {
+                    "name": _KEYWORD,
+                    "qty": _KEYWORD,
+                    "text": {"type": "text"},
+                    "descriptions": _KEYWORD,
+                },
+            },
+            "identifiers": {
+                "type": "nested",
+                "properties": {
+                    "type": _KEYWORD,
+                    "value": _TEXT,
+                    "description": {"type": "text"},
+                },
+            },
+            "tracklist": {
+                "type": "nested",
+                "properties": {
+                    "position": _KEYWORD,
+                    "title": _TEXT,
+                    "duration": _KEYWORD,
+                    "artists": _CREDIT,
+                    "extraartists": _CREDIT,
+                },
+            },
+            "master_id": {
+                "properties": {"#text": _KEYWORD, "is_main_release": {"type": "boolean"}},
+            },
+        },
+    },
+    "artists": {
+        "dynamic": False,
+        "properties": {
+            "name": _FOLDED,
+            "realname": _FOLDED,
+            "namevariations": _FOLDED,
+            "profile": {"type": "text"},
+            "data_quality": _KEYWORD,
+            "urls": {"type": "keyword", "index": False},
+            "aliases": _NAME,
+            "groups": _NAME,
+            "members": {"properties": {"name": _NAME}},
+        },
+    },
+}
+
+PARSERS = {"releases": release, "artists": artist}
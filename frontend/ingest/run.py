@@ -0,0 +1,294 @@
+"""Index a gzipped Discogs dump into a fresh index and point the alias at it.
+
+The dump is read as a stream and cut into chunks of whole records at their
+closing tags. Worker processes parse and bulk-index the chunks, so memory
+stays flat however large the dump is. The app keeps reading the old index
+through the alias until the new one is complete, then one alias update
+switches every reader over.
+
+A checkpoint file records how far into the dump every chunk has been
+indexed. Running the same command again after a crash skips to that point;
+records indexed past it are indexed again under the same ids.
+
+    python -m ingest.run releases discogs_20240901_releases.xml.gz
+"""
+
+import argparse
+import concurrent.futures
+import datetime as dt
+import gzip
+import json
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from elasticsearch import helpers
+
+from clients import es
+from ingest.documents import MAPPINGS, PARSERS, SETTINGS
+
+READ_SIZE = 2**20
+BULK_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+def emit(line=""):
+    print(line, flush=True)  # noqa: T201
+
+
+def chunks(stream, kind, records):
+    """Yield ``(start, end, data)`` for every ``records`` whole records of ``stream``.
+
+    Offsets are positions in the decompressed dump; ``data`` may begin with
+    the XML declaration and the root element, and the last chunk ends with
+    the root's closing tag.
+    """
+    closing = f"</{kind[:-1]}>".encode()
+    buffer = bytearray()
+    offset = stream.tell()
+    scanned = 0
+    count = 0
+    while block := stream.read(READ_SIZE):
+        buffer += block
+        while (found := buffer.find(closing, scanned)) != -1:
+            scanned = found + len(closing)
+            count += 1
+            if count == records:
+                yield offset, offset + scanned, bytes(buffer[:scanned])
+                del buffer[:scanned]
+                offset += scanned
+                scanned = count = 0
+        # a closing tag may straddle two reads
+        scanned = max(scanned, len(buffer) - len(closing) + 1)
+    if count:
+        yield offset, offset + len(buffer), bytes(buffer)
+
+
+def parse(kind, data):
+    tag = kind[:-1].encode()
+    start = re.search(rb"<" + tag + rb"[\s>]", data)
+    end = data.rfind(b"</" + tag + b">")
+    if start is None or end == -1:
+        return []
+    # drop the dump's declaration and root tags, whichever of them this chunk holds
+    records = data[start.start() : end + len(tag) + 3]
+    root = ET.fromstring(b"<root>" + records + b"</root>")  # noqa: S314
+    return [PARSERS[kind](element) for element in root]
+
+
+def index_chunk(kind, index, data):
+    """Parse and index one chunk in a worker.
+
+    Returns the number of docs indexed, a few failures to show and the
+    number of failures.
+    """
+    actions = (
+        {"_index": index, "_id": doc_id, "_source": doc}
+        for doc_id, doc in parse(kind, data)
+        if doc_id
+    )
+    indexed, errors = helpers.bulk(
+        es().options(request_timeout=120, retry_on_timeout=True, max_retries=5),
+        actions,
+        chunk_size=500,
+        raise_on_error=False,
+        raise_on_exception=False,
+    )
+    return indexed, errors[:5], len(errors)
+
+
+class Checkpoint:
+    """How far into the dump every chunk has been indexed, kept in a JSON file."""
+
+    def __init__(self, path, dump, index):
+        self.path = Path(path)
+        self.dump = str(dump)
+        self.index = index
+        self.offset = 0
+        self.indexed = 0
+        self.errors = 0
+        self._done = {}
+
+    def load(self):
+        if not self.path.exists():
+            return False
+        with self.path.open() as f:
+            state = json.load(f)
+        if (state["dump"], state["index"]) != (self.dump, self.index):
+            msg = f"{self.path} belongs to {state['dump']} -> {state['index']}"
+            raise SystemExit(msg)
+        self.offset = state["offset"]
+        self.indexed = state["indexed"]
+        self.errors = state["errors"]
+        return True
+
+    def done(self, start, end, indexed, errors):
+        """Mark a chunk indexed, moving the offset once everything before it is too."""
+        self._done[start] = (end, indexed, errors)
+        moved = False
+        while self.offset in self._done:
+            self.offset, indexed, errors = self._done.pop(self.offset)
+            self.indexed += indexed
+            self.errors += errors
+            moved = True
+        if moved:
+            self._save()
+
+    def _save(self):
+        state = {
+            "dump": self.dump,
+            "index": self.index,
+            "offset": self.offset,
+            "indexed": self.indexed,
+            "errors": self.errors,
+        }
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w") as f:
+            json.dump(state, f)
+        tmp.replace(self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+class Progress:
+    def __init__(self, every, checkpoint):
+        self.every = every
+        self.started = self.last = time.monotonic()
+        self.docs = self.last_docs = self.resumed_at = checkpoint.indexed
+        self.errors = checkpoint.errors
+
+    def add(self, docs, errors):
+        self.docs += docs
+        self.errors += errors
+        now = time.monotonic()
+        if now - self.last >= self.every:
+            recent = (self.docs - self.last_docs) / (now - self.last)
+            emit(
+                f"{self.docs:>12,} docs  {self.rate():>8,.0f} docs/s overall  "
+                f"{recent:>8,.0f} docs/s now  {self.errors:,} errors",
+            )
+            self.last, self.last_docs = now, self.docs
+
+    def rate(self):
+        return (self.docs - self.resumed_at) / max(time.monotonic() - self.started, 1e-9)
+
+
+def create_index(index, kind):
+    es().indices.create(
+        index=index,
+        settings={**SETTINGS, "index": BULK_SETTINGS},
+        mappings=MAPPINGS[kind],
+    )
+
+
+def ingest(args, kind, index, checkpoint):
+    progress = Progress(args.progress, checkpoint)
+    in_flight = {}
+    with (
+        gzip.open(args.dump, "rb") as stream,
+        concurrent.futures.ProcessPoolExecutor(args.workers) as pool,
+    ):
+        # a gzip stream can't seek, decompressing up to the checkpoint is still quick
+        while stream.tell() < checkpoint.offset:
+            stream.read(min(READ_SIZE, checkpoint.offset - stream.tell()))
+
+        def collect(wait):
+            done, _ = concurrent.futures.wait(in_flight, return_when=wait)
+            for future in done:
+                start, end = in_flight.pop(future)
+                indexed, samples, errors = future.result()
+                for sample in samples:
+                    emit(f"failed: {json.dumps(sample)[:500]}")
+                progress.add(indexed, errors)
+                checkpoint.done(start, end, indexed, errors)
+
+        for start, end, data in chunks(stream, kind, args.chunk):
+            # bounded, so a fast reader doesn't queue up the whole dump in memory
+            if len(in_flight) >= 2 * args.workers:
+                collect(concurrent.futures.FIRST_COMPLETED)
+            in_flight[pool.submit(index_chunk, kind, index, data)] = (start, end)
+        collect(concurrent.futures.ALL_COMPLETED)
+    return progress
+
+
+def swap_alias(alias, index, *, drop_index):
+    """Point ``alias`` at ``index`` alone, in one atomic update."""
+    actions = [{"add": {"index": index, "alias": alias}}]
+    old = []
+    if es().indices.exists_alias(name=alias):
+        old = sorted(es().indices.get_alias(name=alias))
+        actions[:0] = [{"remove": {"index": name, "alias": alias}} for name in old if name != index]
+    elif es().indices.exists(index=alias):
+        if not drop_index:
+            msg = f"{alias} is an index, not an alias; pass --drop-index to replace it"
+            raise SystemExit(msg)
+        actions.insert(0, {"remove_index": {"index": alias}})
+    es().indices.update_aliases(actions=actions)
+    return [name for name in old if name != index]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]),
+    )
+    parser.add_argument("kind", choices=sorted(PARSERS))
+    parser.add_argument("dump", type=Path)
+    parser.add_argument("--alias", help="alias the app reads, defaults to the kind")
+    parser.add_argument("--index", help="index to build, defaults to <alias>-<dump date>")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=2000, help="records per worker task")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas once loaded")
+    parser.add_argument("--checkpoint", type=Path, help="defaults to <index>.checkpoint.json")
+    parser.add_argument("--progress", type=float, default=10, help="seconds between reports")
+    parser.add_argument("--no-swap", action="store_true", help="build the index only")
+    parser.add_argument("--drop-index", action="store_true", help="replace an index named alias")
+    parser.add_argument("--allow-errors", action="store_true", help="swap despite failed docs")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv  # noqa: PLC0415
+
+    load_dotenv()
+
+    kind = args.kind
+    alias = args.alias or kind
+    # discogs_20240901_releases.xml.gz -> releases-20240901
+    dated = re.search(r"\d{8}", args.dump.name)
+    date = dated[0] if dated else f"{dt.datetime.now(dt.UTC):%Y%m%d}"
+    index = args.index or f"{alias}-{date}"
+    checkpoint = Checkpoint(args.checkpoint or f"{index}.checkpoint.json", args.dump, index)
+
+    if checkpoint.load():
+        emit(f"resuming {index} at byte {checkpoint.offset:,}, {checkpoint.indexed:,} docs in")
+    elif es().indices.exists(index=index):
+        msg = f"{index} exists without a checkpoint, delete it or pick another --index"
+        raise SystemExit(msg)
+    else:
+        create_index(index, kind)
+        emit(f"created {index}")
+
+    progress = ingest(args, kind, index, checkpoint)
+    emit(f"{progress.docs:,} docs indexed, {progress.rate():,.0f} docs/s, {progress.errors} errors")
+
+    es().indices.put_settings(
+        index=index,
+        settings={"refresh_interval": None, "number_of_replicas": args.replicas},
+    )
+    es().indices.refresh(index=index)
+    checkpoint.remove()
+
+    if args.no_swap:
+        return
+    if progress.errors and not args.allow_errors:
+        msg = f"not pointing {alias} at {index}, {progress.errors} docs failed"
+        raise SystemExit(msg)
+    old = swap_alias(alias, index, drop_index=args.drop_index)
+    # left in place: open points in time still read them until they expire
+    emit(f"{alias} -> {index}" + (f", previously {', '.join(old)}" if old else ""))
+
+
+if __name__ == "__main__":
+    main()
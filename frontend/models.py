@@ -0,0 +1,87 @@
+"""Tables the frontend reads, declared to match db/migrations.
+
+Declared rather than reflected so importing the app never has to reach
+Postgres; a migration changing these tables must update them too.
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    CheckConstraint,
+    Column,
+    Float,
+    ForeignKey,
+    Identity,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+)
+
+db = SQLAlchemy()
+
+
+class User(db.Model):
+    __tablename__ = "users"
+    __table_args__ = (UniqueConstraint("discogs_user_id", name="users_discogs_user_id_key"),)
+
+    user_id = Column(Integer, Identity(always=True), primary_key=True)
+    discogs_oauth_token = Column(String(128), nullable=False)
+    discogs_oauth_token_secret = Column(String(128), nullable=False)
+    discogs_user_id = Column(Integer, nullable=False)
+    username = Column(String(255), nullable=False)
+    wantlist = Column(LargeBinary)
+    wantlist_version = Column(Integer, nullable=False, server_default="0")
+    hidden = Column(LargeBinary)
+    hidden_version = Column(Integer, nullable=False, server_default="0")
+
+
+class Action(db.Model):
+    __tablename__ = "actions"
+    __table_args__ = (CheckConstraint("action IN ('HIDE', 'WATCH')"),)
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    action = Column(Text, primary_key=True)
+    identifier = Column(Integer, primary_key=True)
+
+
+class WantlistChange(db.Model):
+    """A want or unwant not yet compacted into ``User.wantlist``."""
+
+    __tablename__ = "wantlist_changes"
+    __table_args__ = (
+        Index("wantlist_changes_user_id_idx", "user_id", "change_id"),
+        # ids are never reused on SQLite either, a sync tells the changes after it started by them
+        {"sqlite_autoincrement": True},
+    )
+
+    # plain INTEGER on SQLite, the only type it autoincrements
+    change_id = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        Identity(always=True),
+        primary_key=True,
+    )
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
+    release_id = Column(Integer, nullable=False)
+    wanted = Column(Boolean, nullable=False)
+
+
+class WantlistSync(db.Model):
+    """The user's last Discogs wantlist sync, shared by every worker.
+
+    The row is the lock a sync holds while it runs, its heartbeat telling a
+    live sync from one whose worker died.
+    """
+
+    __tablename__ = "wantlist_syncs"
+
+    user_id = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    state = Column(Text, nullable=False)
+    # when the sync holding the row started, its progress only goes on its own row
+    started = Column(Float, nullable=False)
+    heartbeat = Column(Float, nullable=False)
+    progress = Column(JSON, nullable=False)
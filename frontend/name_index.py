@@ -0,0 +1,277 @@
+"""Optional in-process prefix index for the artist and label typeahead.
+
+Every folded name is indexed once per word, so "aphex twin" is found by both
+"aph" and "twi" -- close to what ES' bool_prefix does for a single field, but
+answered locally in microseconds. Anything the index has no answer for still
+goes to ES.
+
+Keys live in one sorted ``bytes`` blob with ``array`` offsets rather than
+Python strings, which costs a fraction of the memory for millions of names.
+They are sorted in runs as they come in and merged straight into the blob,
+so a build never holds more than one run of them as Python objects.
+"""
+
+import bisect
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+
+from elasticsearch import helpers
+
+from file_cache import SharedValue
+
+logger = logging.getLogger(__name__)
+
+# keys sorted at a time while building, the rest of them are packed already
+RUN_SIZE = 1 << 18
+# how often a worker looks for a snapshot another one built
+CHECK_SECONDS = 60
+# by_artist shows two lines of the profile, there is no point in keeping more
+PROFILE_CHARS = 200
+# part of the snapshot's file name, a worker never loads one pickled by other code
+SNAPSHOT_FORMAT = 2
+
+
+def fold(text):
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+class _Blob:
+    """Sequence view of the strings packed into ``data`` at ``offsets``."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i] : self.offsets[i + 1]])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def append(self, s):
+        self.data += s
+        self.offsets.append(len(self.data))
+
+    @classmethod
+    def pack(cls, strings):
+        blob = cls()
+        for s in strings:
+            blob.append(s)
+        return blob
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+
+class NameIndex:
+    def __init__(self, records, run_size=RUN_SIZE):
+        """``records`` yields ``(id, display_name, names, weight, detail)``."""
+        self.ids = array("Q")
+        self.weights = array("Q")
+        self.displays = _Blob()
+        self.details = _Blob()
+        runs = list(self._runs(self._keys(records), run_size))
+        self.docs = array("I")
+        self.keys = _Blob.pack(self._merge(runs, self.docs))
+
+    def _keys(self, records):
+        """Yield ``(key, doc)`` for every word of every name, noting the records."""
+        for doc, (id_, display, names, weight, detail) in enumerate(records):
+            self.ids.append(int(id_))
+            self.weights.append(weight)
+            self.displays.append(display.encode())
+            self.details.append(detail.encode())
+            for name in {fold(n) for n in names if n}:
+                words = name.split(" ")
+                for w in range(len(words)):
+                    yield " ".join(words[w:]).encode(), doc
+
+    @staticmethod
+    def _merge(runs, docs):
+        """Yield the keys of the sorted ``runs`` in order, appending their docs to ``docs``."""
+        for key, doc in heapq.merge(*(zip(keys, d, strict=True) for keys, d in runs)):
+            docs.append(doc)
+            yield key
+
+    @staticmethod
+    def _runs(keys, size):
+        """Sort ``keys`` ``size`` at a time, packing each run as it is sorted."""
+        while run := sorted(itertools.islice(keys, size)):
+            yield _Blob.pack(k for k, _ in run), array("I", (d for _, d in run))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nbytes(self):
+        return (
+            self.keys.nbytes()
+            + self.displays.nbytes()
+            + self.details.nbytes()
+            + self.docs.itemsize * len(self.docs)
+            + self.ids.itemsize * len(self.ids)
+            + self.weights.itemsize * len(self.weights)
+        )
+
+    def search(self, query, limit=100, scan=2000):
+        """Names with a word starting with ``query``, as ``(id, display_name, weight, detail)``.
+
+        Looks at the first ``scan`` keys in sort order and ranks exact
+        matches first, then by weight.
+        """
+        prefix = fold(query).encode()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = min(bisect.bisect_left(self.keys, prefix + b"\xff"), start + scan)
+
+        exact = {}
+        for i in range(start, end):
+            doc = self.docs[i]
+            exact[doc] = exact.get(doc) or self.keys[i] == prefix
+        docs = sorted(exact, key=lambda d: (not exact[d], -self.weights[d]))[:limit]
+        return [
+            (self.ids[d], self.displays[d].decode(), self.weights[d], self.details[d].decode())
+            for d in docs
+        ]
+
+
+def artist_records(es):
+    for hit in helpers.scan(
+        es,
+        index="artists",
+        _source=["name", "namevariations", "realname", "profile"],
+        size=5000,
+    ):
+        source = hit["_source"]
+        yield (
+            hit["_id"],
+            source.get("name", ""),
+            [source.get("name"), source.get("realname"), *source.get("namevariations", [])],
+            0,
+            (source.get("profile") or "")[:PROFILE_CHARS],
+        )
+
+
+def label_records(es):
+    after = None
+    while True:
+        composite = {
+            "size": 10000,
+            "sources": [
+                {"id": {"terms": {"field": "labels.id"}}},
+                {"name": {"terms": {"field": "labels.name.keyword"}}},
+            ],
+        }
+        if after:
+            composite["after"] = after
+        page = es.search(
+            index="releases",
+            size=0,
+            aggs={
+                "labels": {
+                    "nested": {"path": "labels"},
+                    "aggs": {"names": {"composite": composite}},
+                },
+            },
+        )["aggregations"]["labels"]["names"]
+        for bucket in page["buckets"]:
+            key = bucket["key"]
+            yield key["id"], key["name"], [key["name"]], bucket["doc_count"], ""
+        after = page.get("after_key")
+        if not after:
+            return
+
+
+class _Snapshot(SharedValue):
+    def _read(self, f):
+        return pickle.load(f)  # noqa: S301
+
+    def _write(self, value, f):
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class LocalIndex:
+    """Keeps the host's ``NameIndex`` snapshot loaded, rebuilt once every ``interval``.
+
+    The snapshot is shared like the facets: each worker checks it every
+    ``CHECK_SECONDS`` and loads a newer one, and once it is older than
+    ``interval`` one worker, holding the snapshot's lock, rebuilds it while the
+    rest keep searching the old index. ``search`` returns nothing until the
+    first load or build has finished.
+    """
+
+    def __init__(self, name, records, snapshot, interval):
+        self.name = name
+        self.records = records
+        snapshot = Path(snapshot)
+        self.snapshot = _Snapshot(
+            snapshot.with_name(f"{snapshot.stem}-{SNAPSHOT_FORMAT}{snapshot.suffix}"),
+            self._build,
+            interval,
+        )
+        self.index = None
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # the refresh thread does not survive a fork, the child starts its own
+        started = self._thread is not None
+        self._lock = threading.Lock()
+        self._thread = None
+        if started:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"name-index-{self.name}",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def search(self, query, limit=100):
+        return self.index.search(query, limit) if self.index else []
+
+    def _run(self):
+        while True:
+            try:
+                # waits for the worker building the first snapshot, if there is none yet
+                index = self.snapshot.get()
+            except Exception:
+                logger.exception("loading the %s name index failed", self.name)
+            else:
+                if index is not self.index:
+                    self.index = index
+                    self.stats = {**self.stats, "names": len(index), "bytes": index.nbytes()}
+                self.stats = {**self.stats, **self.snapshot.stats()}
+            time.sleep(CHECK_SECONDS)
+
+    def _build(self):
+        started = time.perf_counter()
+        index = NameIndex(self.records())
+        elapsed = time.perf_counter() - started
+        self.stats = {**self.stats, "build_seconds": elapsed}
+        logger.info(
+            "built %s name index: %d names, %.1f MiB in %.1fs",
+            self.name,
+            len(index),
+            index.nbytes() / 2**20,
+            elapsed,
+        )
+        return index
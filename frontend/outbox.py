@@ -0,0 +1,240 @@
+"""Wants and unwants on their way to Discogs.
+
+The views change the local wantlist right away and leave the Discogs call
+here. Calls are kept in a SQLite file shared by every worker on the host, so
+none are lost to a restart, and a background thread in each worker sends
+them with ``send(entry)``, retrying with exponential backoff.
+
+Only the latest call for a user and release matters, so queuing one drops
+any older call for the same release that hasn't been sent yet, and a release
+never has two calls in flight. Calls that ``send`` rejects, or that run out
+of attempts, are kept as failures for the user to retry or dismiss.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# long enough for any send to finish, after that a claimed call counts as lost with its worker
+LEASE = 60
+POLL = 30
+KEEP_FAILED = 7 * 86400
+
+
+class RejectedError(Exception):
+    """Raised by ``send`` for calls that retrying won't fix."""
+
+
+class Outbox:
+    def __init__(self, path, send, max_attempts, backoff):
+        self.path = path
+        self.send = send
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.sent = 0
+        self.retries = 0
+        self.failures = 0
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # the sender thread does not survive a fork, the child starts its own
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " entry_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id INTEGER NOT NULL,"
+                " username TEXT NOT NULL,"
+                " release_id INTEGER NOT NULL,"
+                " wanted INTEGER NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " due REAL NOT NULL,"
+                " error TEXT)",
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, due)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_release ON outbox (user_id, release_id)",
+            )
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+                self._thread.start()
+
+    def put(self, user_id, username, release_id, *, wanted):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM outbox WHERE user_id = ? AND release_id = ? AND state != 'sending'",
+                (user_id, release_id),
+            )
+            conn.execute(
+                "INSERT INTO outbox (user_id, username, release_id, wanted, due)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (user_id, username, release_id, wanted, time.time()),
+            )
+        self.start()
+        self._wake.set()
+
+    def status(self, user_id):
+        """The user's number of calls not sent yet and the calls that failed."""
+        conn = self._connection()
+        [pending] = conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE user_id = ? AND state != 'failed'",
+            (user_id,),
+        ).fetchone()
+        failed = conn.execute(
+            "SELECT entry_id, release_id, wanted, error FROM outbox"
+            " WHERE user_id = ? AND state = 'failed' ORDER BY entry_id",
+            (user_id,),
+        ).fetchall()
+        return {"pending": pending, "failed": [dict(row) for row in failed]}
+
+    def retry(self, user_id, entry_id):
+        self._connection().execute(
+            "UPDATE outbox SET state = 'pending', attempts = 0, due = ?, error = NULL"
+            " WHERE entry_id = ? AND user_id = ? AND state = 'failed'",
+            (time.time(), entry_id, user_id),
+        )
+        self.start()
+        self._wake.set()
+
+    def dismiss(self, user_id, entry_id):
+        self._connection().execute(
+            "DELETE FROM outbox WHERE entry_id = ? AND user_id = ? AND state = 'failed'",
+            (entry_id, user_id),
+        )
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                entry = self._claim()
+                if entry is not None:
+                    self._deliver(entry)
+                    continue
+                timeout = self._timeout()
+            except sqlite3.Error:
+                logger.exception("the outbox sender hit a database error")
+                timeout = POLL
+            self._wake.wait(timeout)
+
+    def _claim(self):
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE outbox SET state = 'pending' WHERE state = 'sending' AND due < ?",
+                (now,),
+            )
+            conn.execute(
+                "DELETE FROM outbox WHERE state = 'failed' AND due < ?",
+                (now - KEEP_FAILED,),
+            )
+            entry = conn.execute(
+                "SELECT * FROM outbox AS o WHERE state = 'pending' AND due <= ?"
+                " AND NOT EXISTS (SELECT 1 FROM outbox WHERE user_id = o.user_id"
+                " AND release_id = o.release_id AND state = 'sending')"
+                " ORDER BY entry_id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if entry is not None:
+                conn.execute(
+                    "UPDATE outbox SET state = 'sending', due = ? WHERE entry_id = ?",
+                    (now + LEASE, entry["entry_id"]),
+                )
+        return entry
+
+    def _timeout(self):
+        [due] = (
+            self._connection()
+            .execute(
+                "SELECT MIN(due) FROM outbox WHERE state != 'failed'",
+            )
+            .fetchone()
+        )
+        if due is None:
+            return POLL
+        # at least a second, in case what is due waits on a call another worker is sending
+        return min(max(due - time.time(), 1), POLL)
+
+    def _deliver(self, entry):
+        try:
+            self.send(entry)
+        except RejectedError as e:
+            self._settle(entry, str(e))
+            return
+        except Exception as e:
+            attempts = entry["attempts"] + 1
+            if attempts >= self.max_attempts:
+                logger.exception("giving up on outbox entry %s", entry["entry_id"])
+                self._settle(entry, str(e))
+                return
+            logger.warning("outbox entry %s failed, will retry: %s", entry["entry_id"], e)
+            with self._lock:
+                self.retries += 1
+            self._settle(entry, str(e), retry_at=time.time() + self.backoff * 2**attempts)
+            return
+        with self._lock:
+            self.sent += 1
+        self._connection().execute("DELETE FROM outbox WHERE entry_id = ?", (entry["entry_id"],))
+
+    def _settle(self, entry, error, retry_at=None):
+        """Queue a call that didn't go through again at ``retry_at``, or keep it as failed."""
+        if retry_at is None:
+            with self._lock:
+                self.failures += 1
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # a newer call for the release, queued while this one was sent, decides instead
+            conn.execute(
+                "DELETE FROM outbox WHERE entry_id = ? AND EXISTS (SELECT 1 FROM outbox"
+                " WHERE user_id = ? AND release_id = ? AND entry_id > ?)",
+                (entry["entry_id"], entry["user_id"], entry["release_id"], entry["entry_id"]),
+            )
+            conn.execute(
+                "UPDATE outbox SET state = ?, attempts = ?, due = ?, error = ? WHERE entry_id = ?",
+                (
+                    "failed" if retry_at is None else "pending",
+                    entry["attempts"] + 1,
+                    retry_at or time.time(),
+                    error,
+                    entry["entry_id"],
+                ),
+            )
+
+    def stats(self):
+        counts = dict(
+            self._connection().execute("SELECT state, COUNT(*) FROM outbox GROUP BY state"),
+        )
+        return {
+            "pending": counts.get("pending", 0),
+            "sending": counts.get("sending", 0),
+            "failed": counts.get("failed", 0),
+            "sent": self.sent,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
@@ -0,0 +1,73 @@
+"""Price suggestions of a release, or of its master release when it has none.
+
+Discogs suggests no prices for many pressings, so a release other than its
+master's main release is looked up together with the master, and whichever
+answer is needed is already there. Cards pass the master from the release
+document they were rendered from; for the rest the release->master mapping
+is looked up once and cached alongside the prices.
+
+Everything goes through the ``DiscogsCache``: empty answers are cached like
+any other and concurrent lookups of the same key share one upstream call.
+Suggestions are in the currency the user set on Discogs, so each user's are
+cached apart; the release->master mapping is the same for everyone.
+"""
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class PriceService:
+    def __init__(self, cache):
+        self.cache = cache
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pool = ThreadPoolExecutor(8, thread_name_prefix="prices")
+
+    def _submit(self, func, *args):
+        # run in the caller's context, so the lookups show up in its timings
+        return self._pool.submit(contextvars.copy_context().run, func, *args)
+
+    def _prices(self, user_id, release_id, fetch):
+        return self.cache.get_or_fetch(
+            "price",
+            f"{user_id}/{release_id}",
+            partial(fetch, release_id),
+        )
+
+    def get(self, user_id, release_id, master_id, fetch, fetch_master):
+        """Return the suggestions of ``release_id``, or of its master if those are ``{}``.
+
+        ``master_id`` is the master to fall back on, ``""`` for none or ``None``
+        if the caller doesn't know. ``fetch(release_id)`` fetches suggestions
+        for ``user_id`` and ``fetch_master(release_id)`` the master id, ``""``
+        for none. Both run on the service's threads.
+        """
+        if master_id is None:
+            cached = self.cache.get_many("master", [release_id]).get(str(release_id))
+            if cached is not None:
+                master_id = cached[0]["master_id"]
+
+        if master_id is None:
+            # look the master up while the release's own suggestions are fetched
+            lookup = self._submit(
+                self.cache.get_or_fetch,
+                "master",
+                release_id,
+                lambda: {"master_id": fetch_master(release_id)},
+            )
+            prices = self._prices(user_id, release_id, fetch)
+            if prices != {}:
+                return prices
+            master_id = lookup.result()["master_id"]
+            return self._prices(user_id, master_id, fetch) if master_id else prices
+
+        if not master_id:
+            return self._prices(user_id, release_id, fetch)
+
+        master = self._submit(self._prices, user_id, master_id, fetch)
+        prices = self._prices(user_id, release_id, fetch)
+        return prices if prices != {} else master.result()
@@ -0,0 +1,90 @@
+"""Run the app on a throwaway SQLite database, with every other service unreachable.
+
+The environment is set before anything imports ``app``, which reads it at
+import time; nothing here may reach Elasticsearch, axum or Discogs.
+"""
+
+import os
+import signal
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+# the discard port, connections to it are refused
+UNREACHABLE = "http://127.0.0.1:9"
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="acetate-tests-"))
+
+ENVIRONMENT = {
+    "ES_URL": UNREACHABLE,
+    "AXUM_API": UNREACHABLE + "/",
+    "DISCOGS_API": UNREACHABLE,
+    "DATABASE_URL": f"sqlite:///{WORKDIR / 'tests.sqlite3'}",
+    "DISCOGS_CACHE_PATH": str(WORKDIR / "discogs.sqlite3"),
+    "OUTBOX_PATH": str(WORKDIR / "outbox.sqlite3"),
+    "FACET_CACHE_PATH": str(WORKDIR / "facets.json"),
+    "NAME_INDEX": "off",
+    "DISCOGS_CLIENT_ID": "tests",
+    "DISCOGS_CLIENT_SECRET": "tests",
+}
+
+os.environ.update(ENVIRONMENT)
+os.environ.pop("APM_SERVER_URL", None)
+
+
+def fork(child):
+    """Run ``child`` in a forked process, returns a function waiting for it to return true."""
+    pid = os.fork()
+    if pid == 0:
+        succeeded = False
+        try:
+            succeeded = child()
+        finally:
+            os._exit(0 if succeeded else 1)
+
+    def succeeded(timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return os.waitstatus_to_exitcode(status) == 0
+            time.sleep(0.05)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        return False
+
+    return succeeded
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app  # noqa: PLC0415
+
+    with app.app.app_context():
+        app.db.create_all()
+    return app
+
+
+@pytest.fixture
+def user_id(app_module):
+    """A new user, with an empty wantlist and nothing hidden."""
+    return new_user(app_module)
+
+
+def new_user(app_module):
+    with app_module.app.app_context():
+        db = app_module.db
+        discogs_user_id = (
+            db.session.scalar(db.select(db.func.max(app_module.User.discogs_user_id))) or 0
+        ) + 1
+        user = app_module.User(
+            discogs_oauth_token="tests",  # noqa: S106
+            discogs_oauth_token_secret="tests",  # noqa: S106
+            discogs_user_id=discogs_user_id,
+            username=f"tests{discogs_user_id}",
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user.user_id
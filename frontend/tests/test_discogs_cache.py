@@ -0,0 +1,26 @@
+"""A stale entry is served while its refresh runs, a failed refresh is logged and counted."""
+
+import logging
+import time
+
+from discogs_cache import DiscogsCache
+
+
+def failing():
+    msg = "Discogs is down"
+    raise ConnectionError(msg)
+
+
+def test_failed_refresh_is_logged_and_counted(tmp_path, caplog):
+    cache = DiscogsCache(tmp_path / "discogs.sqlite3", {"release": (0, 3600)})
+    cache.put("release", 1, {"thumb": "old"})
+
+    with caplog.at_level(logging.WARNING, logger="discogs_cache"):
+        assert cache.get_or_fetch("release", 1, failing) == {"thumb": "old"}
+        deadline = time.monotonic() + 10
+        while not cache.stats()["refresh_failures"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert cache.stats() == {"fetches": 1, "failures": 1, "refreshes": 1, "refresh_failures": 1}
+    assert "refreshing release 1 from Discogs failed" in caplog.text
+    assert cache.get_or_fetch_many("release", [1], lambda _: failing()) == {"1": {"thumb": "old"}}
@@ -0,0 +1,62 @@
+"""A worker forked while the master fetches waits for that fetch instead of hanging on it."""
+
+import threading
+import time
+
+from file_cache import SharedValue
+
+from .conftest import fork
+
+
+def test_fork_during_a_fetch_loads_its_value(tmp_path):
+    fetching = threading.Event()
+    done = threading.Event()
+
+    def fetch():
+        fetching.set()
+        done.wait()
+        return {"fetched": "master"}
+
+    value = SharedValue(tmp_path / "value.json", fetch, 3600)
+    master = threading.Thread(target=value.get)
+    master.start()
+    fetching.wait()
+
+    def worker():
+        # the master's fetch is not forked with it, a second one must not run
+        value.fetch = lambda: {"fetched": "worker"}
+        return value.get() == {"fetched": "master"}
+
+    succeeded = fork(worker)
+    done.set()
+    master.join()
+
+    assert succeeded()
+
+
+def test_refreshes_after_a_fork_during_a_refresh(tmp_path):
+    fetching = threading.Event()
+    done = threading.Event()
+
+    def fetch():
+        fetching.set()
+        done.wait()
+        return "master"
+
+    # stale as soon as it is written
+    value = SharedValue(tmp_path / "value.json", lambda: "first", 0)
+    value.get()
+    value.fetch = fetch
+    value.get()
+    fetching.wait()
+
+    def worker():
+        value.fetch = lambda: "worker"
+        while value.get() != "worker":
+            time.sleep(0.05)
+        return True
+
+    succeeded = fork(worker)
+    done.set()
+
+    assert succeeded()
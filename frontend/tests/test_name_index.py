@@ -0,0 +1,92 @@
+"""The name index builds the same in runs, and once per host however many workers ask."""
+
+import threading
+import time
+
+import name_index
+
+from .conftest import fork
+
+ARTISTS = [
+    ("1", "Aphex Twin", ["Aphex Twin", "Richard David James", "AFX"], 0, "Cornish musician"),
+    ("2", "Autechre", ["Autechre", "Ae"], 0, ""),
+    ("3", "Boards of Canada", ["Boards of Canada", "BoC"], 0, "Scottish duo"),
+    ("4", "Björk", ["Björk", "Bjork Gudmundsdottir"], 0, ""),
+    ("5", "The Aphex Twins", ["The Aphex Twins"], 3, ""),
+]
+
+
+def test_runs_merge_into_the_same_index():
+    whole = name_index.NameIndex(iter(ARTISTS))
+    runs = name_index.NameIndex(iter(ARTISTS), run_size=2)
+
+    assert list(runs.keys) == list(whole.keys) == sorted(whole.keys)
+    assert list(runs.docs) == list(whole.docs)
+    assert runs.search("twin") == whole.search("twin")
+
+
+def test_search_keeps_the_detail():
+    index = name_index.NameIndex(iter(ARTISTS))
+
+    assert index.search("aph") == [
+        (5, "The Aphex Twins", 3, ""),
+        (1, "Aphex Twin", 0, "Cornish musician"),
+    ]
+    assert index.search("bjor") == [(4, "Björk", 0, "")]
+
+
+def test_workers_share_one_build(tmp_path):
+    builds = []
+
+    def records():
+        builds.append(threading.get_ident())
+        return iter(ARTISTS)
+
+    workers = [
+        name_index.LocalIndex("artists", records, tmp_path / "artists.idx", 3600) for _ in range(4)
+    ]
+    found = []
+    # every worker starts together with no snapshot on disk
+    barrier = threading.Barrier(len(workers))
+
+    def load(worker):
+        barrier.wait()
+        found.append(worker.snapshot.get().search("autechre"))
+
+    threads = [threading.Thread(target=load, args=(w,)) for w in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert found == [[(2, "Autechre", 0, "")]] * len(workers)
+
+
+def test_fork_during_the_build_loads_it(tmp_path):
+    building = threading.Event()
+    done = threading.Event()
+
+    def records():
+        building.set()
+        done.wait()
+        return iter(ARTISTS)
+
+    index = name_index.LocalIndex("artists", records, tmp_path / "artists.idx", 3600)
+    index.start()
+    building.wait()
+
+    def worker():
+        # a second build would find nothing
+        index.records = lambda: iter(())
+        index.start()
+        while not index.search("autechre"):
+            time.sleep(0.05)
+        return index.search("autechre") == [(2, "Autechre", 0, "")]
+
+    succeeded = fork(worker)
+    # long enough for the worker to be waiting on the build
+    time.sleep(0.2)
+    done.set()
+
+    assert succeeded()
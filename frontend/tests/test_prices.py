@@ -0,0 +1,61 @@
+"""Price suggestions are cached per user, and only when Discogs suggested some."""
+
+import pytest
+
+from .conftest import new_user
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:  # noqa: PLR2004
+            msg = f"{self.status_code} from Discogs"
+            raise RuntimeError(msg)
+
+
+@pytest.fixture
+def discogs(app_module, monkeypatch):
+    """Answer price suggestion calls with the responses queued up, returns the queue."""
+    answers = []
+
+    def get(url, **_):
+        assert "/marketplace/price_suggestions/" in url
+        return answers.pop(0)
+
+    monkeypatch.setattr(app_module.oauth.discogs, "get", get)
+    return answers
+
+
+def prices(app_module, user_id, release_id):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"id": user_id, "username": f"tests{user_id}"}
+    # no master to fall back on, nothing asks axum
+    return client.get(f"/prices/{release_id}?master=")
+
+
+def test_each_user_gets_their_own_currency(app_module, discogs):
+    first, second = new_user(app_module), new_user(app_module)
+    discogs.append(Response(200, {"Mint (M)": {"currency": "EUR", "value": 1.5}}))
+    discogs.append(Response(200, {"Mint (M)": {"currency": "JPY", "value": 250.0}}))
+
+    assert "1.50" in prices(app_module, first, 101).get_data(as_text=True)
+    assert "250.00" in prices(app_module, second, 101).get_data(as_text=True)
+    assert "1.50" in prices(app_module, first, 101).get_data(as_text=True)
+    assert discogs == []
+
+
+def test_refusals_are_shown_but_not_cached(app_module, user_id, discogs):
+    refusal = {"message": "You must fill out your seller settings first."}
+    discogs.append(Response(403, refusal))
+    discogs.append(Response(200, {"Mint (M)": {"currency": "EUR", "value": 3.0}}))
+
+    assert prices(app_module, user_id, 102).get_data(as_text=True) == refusal["message"]
+    assert "3.00" in prices(app_module, user_id, 102).get_data(as_text=True)
+    assert discogs == []
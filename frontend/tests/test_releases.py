@@ -0,0 +1,111 @@
+"""Paging a listing opens a point in time only once the user pages, prefetches never do.
+
+Every visitor pages on their own, logged in or not, whatever address they share, and a
+cursor the app could not have made starts the listing over.
+"""
+
+import asyncio
+
+import pytest
+
+import aio
+
+PAGE_SIZE = 5
+HITS = 100
+
+
+@pytest.fixture
+def searches(app_module, monkeypatch):
+    """Record every search and every point in time opened, instead of asking axum."""
+    calls = {"searches": [], "opened": []}
+
+    def fetch_releases(filters, source, hidden, *, pit, search_after, offset, size, count):  # noqa: ARG001, PLR0913
+        calls["searches"].append({"pit": pit, "search_after": search_after, "offset": offset})
+        hits = [{"_id": str(i), "_source": {}, "sort": [i]} for i in range(offset, offset + size)]
+        body = {"hits": {"total": {"value": HITS, "relation": "eq"}, "hits": hits}}
+        if pit:
+            body["pit_id"] = pit
+        return asyncio.sleep(0, result=body)
+
+    async def open_pit():
+        pit = f"pit-{len(calls['opened'])}"
+        calls["opened"].append(pit)
+        return pit
+
+    monkeypatch.setattr(app_module, "fetch_releases", fetch_releases)
+    monkeypatch.setattr(app_module, "open_pit", open_pit)
+    monkeypatch.setattr(app_module, "TOTAL_CACHE_TIMEOUT", 0)
+    return calls
+
+
+def page(app_module, number):
+    with app_module.app.test_request_context(f"/dig?page={number}&pageSize={PAGE_SIZE}"):
+        request = app_module.request
+        result = aio.block(
+            app_module.get_releases(request.args, ["title"], omit_hidden=False, prefetch=True),
+            timeout=10,
+        )
+        prefetched = app_module.prefetches.take(
+            app_module.session_key(),
+            (
+                app_module.filter_key(request.args),
+                ("title",),
+                0,
+                number + 1,
+                PAGE_SIZE,
+                result["next_cursor"],
+            ),
+        )
+    return result, prefetched
+
+
+def test_first_page_opens_no_point_in_time(app_module, searches):
+    _, prefetched = page(app_module, 1)
+    prefetched.result(timeout=10)
+
+    assert searches["opened"] == []
+    assert [s["pit"] for s in searches["searches"]] == [None, None]
+    assert [s["offset"] for s in searches["searches"]] == [0, PAGE_SIZE]
+
+
+def test_paging_prefetches_in_the_point_in_time(app_module, searches):
+    _, prefetched = page(app_module, 2)
+    prefetched.result(timeout=10)
+
+    assert searches["opened"] == ["pit-0"]
+    assert searches["searches"] == [
+        {"pit": "pit-0", "search_after": None, "offset": PAGE_SIZE},
+        {"pit": "pit-0", "search_after": [2 * PAGE_SIZE - 1], "offset": 2 * PAGE_SIZE},
+    ]
+
+
+def test_visitors_behind_one_address_keep_apart(app_module):
+    keys = []
+    for _ in range(2):
+        with app_module.app.test_request_context(environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+            keys.append({app_module.session_key(), app_module.session_key()})
+
+    assert len(keys[0]) == len(keys[1]) == 1
+    assert keys[0] != keys[1]
+
+
+@pytest.mark.usefixtures("searches")
+@pytest.mark.parametrize(
+    "value",
+    [
+        [1],
+        3,
+        {"listing": "x", "pit": None, "sort": None, "page": 0},
+        {"listing": "x", "pit": None, "sort": None, "page": "1", "size": 5},
+    ],
+)
+def test_tampered_cursors_are_ignored(app_module, value):
+    cursor = app_module.encode_cursor(value)
+
+    assert app_module.decode_cursor(cursor) is None
+    with app_module.app.test_request_context(f"/dig?cursor={cursor}"):
+        result = aio.block(
+            app_module.get_releases(app_module.request.args, ["title"], omit_hidden=False),
+            timeout=10,
+        )
+    assert result["next_cursor"]
@@ -0,0 +1,52 @@
+"""Importing the app, as a preloading gunicorn master does, never waits on a service."""
+
+import json
+import os
+import subprocess
+import sys
+
+from bench.run import startup
+
+from .conftest import ENVIRONMENT, UNREACHABLE, WORKDIR
+
+# about 1.5s here, most of it importing elasticsearch and sqlalchemy
+STARTUP_BUDGET = 5
+
+# where the facets and the name index would write, were they fetched at import
+SHARED = WORKDIR / "startup"
+
+ENV = {
+    **os.environ,
+    **ENVIRONMENT,
+    # a connection attempted at import would fail, on top of the wait
+    "DATABASE_URL": "postgresql+psycopg2://tests@127.0.0.1:9/tests",
+    "FACET_CACHE_PATH": str(SHARED / "facets.json"),
+    "NAME_INDEX": "on",
+    "NAME_INDEX_DIR": str(SHARED),
+    "APM_SERVER_URL": UNREACHABLE,
+}
+
+
+def test_app_imports_with_services_unreachable():
+    # exiting waits on the APM agent's last flush, only the import has to be quick
+    seconds, _ = startup(ENV, 0, timeout=60)
+
+    assert seconds < STARTUP_BUDGET
+
+
+def test_app_fetches_nothing_at_import():
+    code = "import json, threading, app; print(json.dumps([t.name for t in threading.enumerate()]))"
+    out = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code],
+        env=ENV,
+        capture_output=True,
+        text=True,
+        check=True,
+        timeout=60,
+    )
+    threads = json.loads(out.stdout.strip().splitlines()[-1])
+
+    # a fork would copy a fetch half done, and its lock with it; the APM agent's
+    # threads are its own to restart in the workers
+    assert [name for name in threads if not name.startswith("eapm ")] == ["MainThread"]
+    assert not SHARED.exists() or not any(SHARED.iterdir())
@@ -0,0 +1,144 @@
+"""Every view renders the same page from the fields it asks for as from whole documents.
+
+Templates run under StrictUndefined, so a field dropped from one of the
+``*_FIELDS`` lists that a template still reads fails its view here instead
+of with a 500 in production; one a template reads leniently changes the page.
+"""
+
+import asyncio
+
+import pytest
+
+from bench import fixtures
+from bench.stubs import project
+
+
+class SearchResponse(dict):
+    """A search result, readable as a mapping and through ``body`` like the client's."""
+
+    @property
+    def body(self):
+        return self
+
+
+@pytest.fixture(scope="module")
+def data():
+    return fixtures.generate(releases=12, artists=8, labels=3)
+
+
+@pytest.fixture
+def serve(app_module, data, monkeypatch):
+    """Answer the app's searches from ``data``, returns the fields each one asked for.
+
+    With ``full`` the whole documents come back whatever was asked for, as
+    before searches projected them.
+    """
+    by_id = {
+        "releases": {r["id"]: r for r in data["releases"]},
+        "artists": {a["id"]: a for a in data["artists"]},
+    }
+
+    def answer(*, full):
+        fields = []
+
+        def hit(doc, includes):
+            fields.append(includes)
+            return {
+                "_id": doc["id"],
+                "_source": project(
+                    {k: v for k, v in doc.items() if k != "id"},
+                    None if full else includes,
+                ),
+                "sort": [doc.get("released"), doc["id"]],
+            }
+
+        async def es_search(*, index, body, **_):
+            hits = [hit(doc, body.get("_source")) for doc in data[index]]
+            total = {"value": len(hits), "relation": "eq"}
+            return SearchResponse(hits={"total": total, "hits": hits})
+
+        async def es_get(*, index, id, source_includes=None):  # noqa: A002
+            return hit(by_id[index][id], source_includes)
+
+        def fetch_releases(filters, source, hidden, *, pit, search_after, offset, size, count):  # noqa: ARG001, PLR0913
+            hits = [hit(doc, source) for doc in data["releases"][offset : offset + size]]
+            total = {"value": len(data["releases"]), "relation": "eq"}
+            return asyncio.sleep(0, result={"hits": {"total": total, "hits": hits}})
+
+        monkeypatch.setattr(app_module, "es_search", es_search)
+        monkeypatch.setattr(app_module, "es_get", es_get)
+        monkeypatch.setattr(app_module, "fetch_releases", fetch_releases)
+        monkeypatch.setattr(app_module, "get_filters", lambda: data["filters"])
+        # start every render from scratch, fragments and small fields included
+        app_module.cache.clear()
+        return fields
+
+    return answer
+
+
+@pytest.fixture
+def client(app_module, user_id):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"id": user_id, "username": f"tests{user_id}"}
+    client.environ_base["HTTP_HX_REQUEST"] = "true"
+    return client
+
+
+@pytest.mark.parametrize(
+    ("path", "fields"),
+    [
+        ("/filter?search={title}", "SEARCH_FIELDS"),
+        ("/label/{label}", "RELEASE_SMALL_FIELDS"),
+        ("/artist/{artist}/releases", "RELEASE_SMALL_FIELDS"),
+        ("/release/{id}", "DISCOVER_FIELDS"),
+        ("/discover", "DISCOVER_FIELDS"),
+        ("/dig", "DIG_FIELDS"),
+    ],
+)
+def test_views_render_projected_releases(app_module, data, serve, client, path, fields):  # noqa: PLR0913, PLR0917
+    release = data["releases"][0]
+    path = path.format(
+        title=release["title"],
+        label=release["labels"][0]["id"],
+        artist=release["artists"][0]["id"],
+        id=release["id"],
+    )
+    serve(full=True)
+    whole = client.get(path)
+    fetched = serve(full=False)
+
+    response = client.get(path)
+
+    assert response.status_code == 200, response.get_data(as_text=True)  # noqa: PLR2004
+    assert getattr(app_module, fields) in fetched
+    assert release["title"] in response.get_data(as_text=True)
+    assert response.get_data(as_text=True) == whole.get_data(as_text=True)
+
+
+@pytest.mark.parametrize("path", ["/want", "/unwant"])
+def test_want_buttons_render_the_small_fields(app_module, data, serve, client, path):
+    release_id = data["releases"][1]["id"]
+    serve(full=True)
+    whole = client.post(path, data={"release_id": release_id})
+    fetched = serve(full=False)
+
+    response = client.post(path, data={"release_id": release_id})
+
+    assert response.status_code == 200, response.get_data(as_text=True)  # noqa: PLR2004
+    assert fetched == [app_module.RELEASE_SMALL_FIELDS]
+    assert response.get_data(as_text=True) == whole.get_data(as_text=True)
+
+
+def test_release_json_has_the_whole_document(data, serve, client):
+    release = data["releases"][2]
+    # left out of every projection
+    credited = [a["name"] for t in release["tracklist"] for a in t["artists"]]
+    fetched = serve(full=False)
+
+    response = client.get(f"/release/{release['id']}/json")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert fetched == [None]
+    assert credited
+    assert all(name in response.get_data(as_text=True) for name in credited)
@@ -0,0 +1,154 @@
+"""Wants, unwants, compactions and a Discogs sync racing each other lose nothing."""
+
+import random
+import threading
+import time
+
+import pytest
+from pyroaring import BitMap
+from sqlalchemy import update
+
+import wantlist_sync
+
+WRITERS = 4
+CHANGES = 60
+RELEASES = range(1, 241)
+
+
+class Response:
+    """Just enough of a ``requests`` response for ``WantlistSync``."""
+
+    status_code = 200
+    headers: dict = {}  # noqa: RUF012
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+
+def discogs(ids, started):
+    """A wantlist endpoint serving ``ids``, pages held back until ``started`` is set."""
+    ids = sorted(ids, reverse=True)
+    pages = max(-(-len(ids) // wantlist_sync.PER_PAGE), 1)
+
+    def fetch(page):
+        started.wait()
+        time.sleep(0.01)
+        start = (page - 1) * wantlist_sync.PER_PAGE
+        return Response(
+            {
+                "pagination": {"pages": pages},
+                "wants": [{"id": i} for i in ids[start : start + wantlist_sync.PER_PAGE]],
+            },
+        )
+
+    return fetch
+
+
+def store(app_module, user_id, bitmap):
+    with app_module.app.app_context():
+        db = app_module.db
+        db.session.execute(
+            update(app_module.User)
+            .where(app_module.User.user_id == user_id)
+            .values(wantlist=BitMap.serialize(bitmap)),
+        )
+        db.session.commit()
+
+
+def snapshot(app_module, user_id):
+    with app_module.app.app_context():
+        return app_module.wantlist_snapshot(user_id)[0]
+
+
+def progress(app_module, user_id):
+    with app_module.app.app_context():
+        return app_module.wantlist_sync_progress(user_id)
+
+
+def write(app_module, user_id, writer, halfway, expected):
+    """Want and unwant the writer's own releases at random, noting the last change to each."""
+    own = [r for r in RELEASES if r % WRITERS == writer]
+    rng = random.Random(writer)  # noqa: S311
+    for n in range(CHANGES):
+        if n == CHANGES // 2:
+            halfway.wait(timeout=30)
+        release_id = rng.choice(own)
+        wanted = rng.random() < 0.5  # noqa: PLR2004
+        with app_module.app.app_context():
+            app_module.record_want(user_id, release_id, wanted=wanted)
+        expected[release_id] = wanted
+
+
+def compact(app_module, user_id, done):
+    """Do what a load does once enough changes piled up, over and over."""
+    User = app_module.User  # noqa: N806
+    while not done.is_set():
+        with app_module.app.app_context():
+            version = app_module.db.session.scalar(
+                app_module.db.select(User.wantlist_version).where(User.user_id == user_id),
+            )
+            bitmap, last_change_id = app_module.wantlist_snapshot(user_id)
+            if last_change_id:
+                app_module.compact_wantlist(
+                    user_id,
+                    version,
+                    BitMap.serialize(bitmap),
+                    last_change_id,
+                )
+        time.sleep(0.001)
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_changes_during_a_sync_are_kept(app_module, user_id, delta):
+    rng = random.Random(1)  # noqa: S311
+    stored = BitMap(rng.sample(RELEASES, 120))
+    # a delta sync stops at the first page with a known id, keep it to one page
+    synced = stored | BitMap([1000, 1001]) if delta else BitMap(rng.sample(RELEASES, 150))
+    store(app_module, user_id, stored)
+
+    started = threading.Event()
+    with app_module.app.app_context():
+        assert app_module.start_wantlist_sync(user_id, discogs(synced, started), delta=delta)
+        assert not app_module.start_wantlist_sync(user_id, discogs(synced, started), delta=delta)
+
+    # every writer owns its releases, so the last change it made to one must stick
+    expected = {}
+    halfway = threading.Barrier(WRITERS + 1)
+    done = threading.Event()
+    writers = [
+        threading.Thread(target=write, args=(app_module, user_id, w, halfway, expected))
+        for w in range(WRITERS)
+    ]
+    compactor = threading.Thread(target=compact, args=(app_module, user_id, done))
+    for thread in [*writers, compactor]:
+        thread.start()
+    # the sync fetches and saves while the second half of the changes comes in
+    halfway.wait(timeout=30)
+    started.set()
+    for thread in writers:
+        thread.join()
+    deadline = time.monotonic() + 30
+    while progress(app_module, user_id)["state"] == "running" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    done.set()
+    compactor.join()
+
+    assert progress(app_module, user_id)["state"] == "done", progress(app_module, user_id)
+    wantlist = snapshot(app_module, user_id)
+    assert [r for r, wanted in expected.items() if (r in wantlist) != wanted] == []
+    # what nobody touched is what the sync fetched
+    assert wantlist - BitMap(expected) == synced - BitMap(expected)
+
+
+@pytest.mark.parametrize("action", ["retry", "dismiss"])
+def test_outbox_actions_logged_out(app_module, action):
+    response = app_module.app.test_client().post(f"/wants/outbox/1/{action}")
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.get_data(as_text=True) == ""
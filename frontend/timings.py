@@ -0,0 +1,111 @@
+"""Cheap timers around the calls a request spends its time in.
+
+``timed(name)`` adds to the current request's breakdown, sent back as a
+``Server-Timing`` header, and to per-worker histograms rendered in the
+Prometheus text format by ``prometheus``. Coroutines handed to the worker
+loop run in a copy of the request's context, so their time lands in the
+same breakdown.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar("timings", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+_lock = threading.Lock()
+_histograms = {}
+
+
+def _reset_after_fork():
+    global _lock  # noqa: PLW0603
+
+    _lock = threading.Lock()
+    _histograms.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def observe(metric, label, seconds):
+    with _lock:
+        histogram = _histograms.get((metric, label))
+        if histogram is None:
+            histogram = _histograms[metric, label] = Histogram()
+        histogram.observe(seconds)
+
+
+def record(name, seconds):
+    timings = _current.get()
+    if timings is not None:
+        total, count = timings.get(name, (0.0, 0))
+        timings[name] = (total + seconds, count + 1)
+    observe("span", name, seconds)
+
+
+@contextlib.contextmanager
+def timed(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def start():
+    """Begin collecting the breakdown for the request in this context."""
+    _current.set({})
+
+
+def server_timing():
+    timings = _current.get() or {}
+    return ", ".join(
+        f"{name};dur={total * 1000:.1f}" + (f';desc="{count}x"' if count > 1 else "")
+        for name, (total, count) in timings.items()
+    )
+
+
+def prometheus(gauges):
+    """Render the histograms, plus ``gauges`` as ``{metric: {labels: value}}``."""
+    lines = []
+    with _lock:
+        histograms = sorted(
+            (metric, label, list(h.counts), h.sum) for (metric, label), h in _histograms.items()
+        )
+
+    seen = set()
+    for metric, label, counts, total in histograms:
+        name = f"acetate_{metric}_seconds"
+        key = "span" if metric == "span" else "endpoint"
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip((*BUCKETS, "+Inf"), counts, strict=True):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{key}="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{key}="{label}"}} {total}')
+        lines.append(f'{name}_count{{{key}="{label}"}} {cumulative}')
+
+    for metric, values in gauges.items():
+        lines.append(f"# TYPE acetate_{metric} gauge")
+        for labels, value in values.items():
+            rendered = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"acetate_{metric}{{{rendered}}} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,151 @@
+"""Background sync of a user's Discogs wantlist into a bitmap.
+
+Pages are fetched concurrently on a small thread pool, paced by the rate limit
+Discogs reports on every response. A delta sync walks the wantlist newest
+first and stops at the first page holding an id we already know.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+
+from pyroaring import BitMap
+
+PER_PAGE = 100
+
+
+class RateLimiter:
+    """Paces requests to stay inside Discogs' moving one-minute window.
+
+    Stops ``reserve`` requests short of the budget so thumbs and prices
+    fetched by the user while the sync runs still get through.
+    """
+
+    window = 60
+
+    def __init__(self, reserve=5):
+        self.reserve = reserve
+        self.limit = 60
+        self.remaining = None
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = monotonic()
+            if self.remaining is None or self.remaining > self.reserve:
+                if self.remaining is not None:
+                    self.remaining -= 1
+                return
+            # out of budget, trickle one request per slot until the headers recover
+            self._next = max(self._next, now) + self.window / self.limit
+            delay = self._next - now
+        sleep(delay)
+
+    def update(self, response):
+        headers = response.headers
+        with self._lock:
+            if "X-Discogs-Ratelimit" in headers:
+                self.limit = max(int(headers["X-Discogs-Ratelimit"]), 1)
+            if "X-Discogs-Ratelimit-Remaining" in headers:
+                self.remaining = int(headers["X-Discogs-Ratelimit-Remaining"])
+
+
+class WantlistSync:
+    """Collects every wanted release id through ``fetch(page) -> response``.
+
+    With ``known`` set this is a delta sync: new ids are added to ``known``
+    and ids removed on Discogs since the last full sync are kept.
+    """
+
+    def __init__(self, fetch, *, known=None, concurrency=4, retries=5, report=None):
+        self.fetch = fetch
+        self.known = known
+        self.concurrency = concurrency
+        self.retries = retries
+        self.report = report or (lambda _progress: None)
+        self.rate_limiter = RateLimiter()
+        self.bitmap = BitMap()
+        self.state = "running"
+        self.pages = None
+        self.pages_done = 0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def progress(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "delta": self.known is not None,
+                "pages": self.pages,
+                "pages_done": self.pages_done,
+                "wants": len(self.bitmap),
+                # a delta sync also fetches the known ids on the page it stops at
+                "added": None if self.known is None else len(self.bitmap - self.known),
+                "error": self.error,
+            }
+
+    def _get_page(self, page):
+        for attempt in range(self.retries):
+            self.rate_limiter.acquire()
+            response = self.fetch(page)
+            self.rate_limiter.update(response)
+            if response.status_code == 429 or response.status_code >= 500:  # noqa: PLR2004
+                sleep(float(response.headers.get("Retry-After", 2**attempt)))
+                continue
+            response.raise_for_status()
+            return response.json()
+        response.raise_for_status()
+        return response.json()
+
+    def _add_page(self, page):
+        wants = self._get_page(page)
+        ids = BitMap(w["id"] for w in wants["wants"])
+        with self._lock:
+            self.bitmap |= ids
+            self.pages = wants["pagination"]["pages"]
+            self.pages_done += 1
+        self.report(self.progress())
+        # the list is newest first, a known id means everything after is known too
+        return self.known is not None and bool(ids & self.known)
+
+    def run(self):
+        if self._add_page(1) or self.pages <= 1:
+            return self._result()
+
+        remaining = range(2, self.pages + 1)
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            if self.known is None:
+                list(pool.map(self._add_page, remaining))
+            else:
+                for start in range(0, len(remaining), self.concurrency):
+                    batch = remaining[start : start + self.concurrency]
+                    if any(pool.map(self._add_page, batch)):
+                        break
+        return self._result()
+
+    def _result(self):
+        if self.known is None:
+            return self.bitmap
+        return self.bitmap | self.known
+
+
+def start(sync, save):
+    """Run ``sync`` on a daemon thread and hand the bitmap to ``save``.
+
+    Only one sync per user may run; the caller holds the lock on that.
+    """
+
+    def work():
+        try:
+            save(sync.run())
+            sync.state = "done"
+        except Exception as e:  # noqa: BLE001
+            sync.state = "failed"
+            sync.error = str(e)
+        finally:
+            sync.report(sync.progress())
+
+    thread = threading.Thread(target=work, name="wantlist-sync", daemon=True)
+    thread.start()
+    return thread
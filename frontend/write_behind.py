@@ -0,0 +1,118 @@
+"""Writes acknowledged before they reach the database.
+
+A ``WriteBehind`` queue collects ``(key, value)`` items and hands them to
+``flush`` in batches from a background thread, once ``max_batch`` items are
+waiting or the oldest has waited ``max_delay`` seconds. Until then
+``pending(key)`` lets reads of the same worker see them. Whatever is left is
+flushed when the worker exits normally.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    def __init__(self, flush, max_batch, max_delay):
+        self.flush_batch = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.flushed = 0
+        self.failures = 0
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+
+    def _reset(self):
+        # the flusher thread does not survive a fork, the child starts its own on first put
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._items = []
+        self._flushing = []
+        self._oldest = None
+        self._thread = None
+        self._closed = False
+
+    def put(self, key, value):
+        with self._lock:
+            if self._closed:
+                msg = "write-behind queue is closed"
+                raise RuntimeError(msg)
+            if not self._items:
+                self._oldest = time.monotonic()
+            self._items.append((key, value))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            if len(self._items) in (1, self.max_batch):
+                self._wake.notify()
+
+    def pending(self, key):
+        with self._lock:
+            return [v for k, v in self._flushing + self._items if k == key]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._closed and not self._due():
+                    self._wake.wait(self._timeout())
+                if self._closed:
+                    return
+            self.flush()
+
+    def _due(self):
+        return len(self._items) >= self.max_batch or (
+            self._items and time.monotonic() - self._oldest >= self.max_delay
+        )
+
+    def _timeout(self):
+        if not self._items:
+            return None
+        return max(self.max_delay - (time.monotonic() - self._oldest), 0)
+
+    def flush(self):
+        with self._lock:
+            batch = self._flushing = self._items
+            self._items = []
+        if not batch:
+            return
+        try:
+            self.flush_batch(batch)
+        except Exception:
+            logger.exception("flushing %d writes failed, will retry", len(batch))
+            with self._lock:
+                self.failures += 1
+                # keep them visible to reads and in order ahead of newer writes
+                self._items = batch + self._items
+                self._flushing = []
+                self._oldest = time.monotonic()
+            return
+        with self._lock:
+            self._flushing = []
+            self.batches += 1
+            self.flushed += len(batch)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+        if self._items:
+            logger.error("dropping %d writes that could not be flushed", len(self._items))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._items),
+                "batches": self.batches,
+                "flushed": self.flushed,
+                "failures": self.failures,
+            }